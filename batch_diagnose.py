@@ -0,0 +1,243 @@
+# batch_diagnose.py
+#
+# Run a set of historical cases through the diagnosis pipeline offline.
+# Symptom extraction and RAG run on a thread pool; disease prediction is
+# batched into one generate call per batch, overlapped with preparing the next
+# batch. Results are appended to a JSONL file as each batch finishes, and a
+# rerun with the same --output skips cases that are already there.
+#
+#   python batch_diagnose.py cases.csv --output results.jsonl
+#   python batch_diagnose.py cases.jsonl --output results.jsonl --batch-size 32 --concurrency 16
+#
+# Each case needs an id plus either free text (extracted with the LLM) or a
+# symptom list (a JSON list, or a comma/semicolon separated string). An
+# optional expected-diagnosis column adds top-1/top-k accuracy to the summary.
+
+import argparse
+import csv
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Any, Dict, Iterator, List, Optional, Set
+
+from diagnosis_pipeline.symptom_vocab import VOCAB
+
+logger = logging.getLogger("batch_diagnose")
+
+
+def iter_cases(path: str) -> Iterator[Dict[str, Any]]:
+    """Stream cases from a CSV or JSONL file without loading it all into memory."""
+    with open(path, encoding="utf-8", newline="") as f:
+        if path.endswith(".csv"):
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def parse_symptoms(value: Any) -> List[str]:
+    if isinstance(value, list):
+        return VOCAB.dedupe(str(s) for s in value)
+    value = (value or "").strip()
+    if value.startswith("["):
+        return VOCAB.dedupe(str(s) for s in json.loads(value))
+    return VOCAB.dedupe(value.replace(";", ",").split(","))
+
+
+def load_done(output: str) -> Set[str]:
+    """IDs already written by an earlier run; a truncated last line is ignored."""
+    done: Set[str] = set()
+    if not os.path.exists(output):
+        return done
+    with open(output, encoding="utf-8") as f:
+        for line in f:
+            try:
+                done.add(str(json.loads(line)["id"]))
+            except (ValueError, KeyError):
+                continue
+    return done
+
+
+def truncate_partial_line(output: str):
+    """Cut a line torn by a crash mid-write, so appended rows start on a line of their own."""
+    if not os.path.exists(output):
+        return
+    with open(output, "rb+") as f:
+        end = pos = f.seek(0, os.SEEK_END)
+        while pos > 0:
+            step = min(4096, pos)
+            f.seek(pos - step)
+            newline = f.read(step).rfind(b"\n")
+            if newline >= 0:
+                pos = pos - step + newline + 1
+                break
+            pos -= step
+        if pos < end:
+            logger.warning(f"Dropping {end - pos} bytes of a partial last line in {output}")
+            f.truncate(pos)
+
+
+def batched(iterable, size: int) -> Iterator[list]:
+    it = iter(iterable)
+    while batch := list(islice(it, size)):
+        yield batch
+
+
+class BatchDiagnoser:
+    """Drives the assistant's extractor, retriever and predictor over batches of cases."""
+
+    def __init__(self, assistant, args: argparse.Namespace):
+        self.assistant = assistant
+        self.args = args
+        self.pool = ThreadPoolExecutor(max_workers=args.concurrency, thread_name_prefix="batch-io")
+
+    def _case_symptoms(self, case: Dict[str, Any]) -> List[str]:
+        if case.get(self.args.symptoms_field):
+            return parse_symptoms(case[self.args.symptoms_field])
+        return self.assistant.symptom_extractor.extract(case.get(self.args.text_field) or "")
+
+    def prepare(self, cases: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Extract symptoms, then run RAG, for every case in the batch concurrently."""
+        symptom_lists = list(self.pool.map(self._case_symptoms, cases))
+        rag_results = list(self.pool.map(
+            lambda symptoms: self.assistant.retriever.rag_lookup(symptoms, top_k=self.args.top_k)
+            if symptoms else [],
+            symptom_lists
+        ))
+        return [
+            {"case": case, "symptoms": symptoms, "rag": rag}
+            for case, symptoms, rag in zip(cases, symptom_lists, rag_results)
+        ]
+
+    def predict(self, prepared: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        with_symptoms = [p for p in prepared if p["symptoms"]]
+        llm_results = self.assistant.predictor.predict_batch(
+            [p["symptoms"] for p in with_symptoms], top_k=self.args.top_k
+        )
+        for p, llm_preds in zip(with_symptoms, llm_results):
+            p["predictions"] = self.assistant.combine_predictions(p["rag"], llm_preds)[:self.args.top_k]
+
+        rows = []
+        for p in prepared:
+            case = p["case"]
+            predictions = p.get("predictions", [])
+            row = {
+                "id": str(case[self.args.id_field]),
+                "symptoms": p["symptoms"],
+                "predictions": predictions,
+                "diagnosis": predictions[0] if predictions else None,
+                "status": "complete" if predictions else ("no_symptoms" if not p["symptoms"] else "no_prediction"),
+            }
+            expected = case.get(self.args.expected_field)
+            if expected:
+                names = [pred["disease"].lower() for pred in predictions]
+                row["expected"] = expected
+                row["top1_hit"] = bool(names) and names[0] == expected.strip().lower()
+                row["topk_hit"] = expected.strip().lower() in names
+            rows.append(row)
+        return rows
+
+    def run(self, cases: Iterator[Dict[str, Any]], out) -> Dict[str, Any]:
+        stats = {"cases": 0, "complete": 0, "expected": 0, "top1": 0, "topk": 0}
+        start = time.perf_counter()
+        batches = batched(cases, self.args.batch_size)
+        # One-batch lookahead: the next batch's I/O-bound prep overlaps this batch's generate call
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="batch-prep") as prep:
+            next_batch = next(batches, None)
+            pending = prep.submit(self.prepare, next_batch) if next_batch else None
+            while pending is not None:
+                prepared = pending.result()
+                next_batch = next(batches, None)
+                pending = prep.submit(self.prepare, next_batch) if next_batch else None
+
+                for row in self.predict(prepared):
+                    out.write(json.dumps(row, ensure_ascii=False) + "\n")
+                    stats["cases"] += 1
+                    stats["complete"] += row["status"] == "complete"
+                    if "expected" in row:
+                        stats["expected"] += 1
+                        stats["top1"] += row["top1_hit"]
+                        stats["topk"] += row["topk_hit"]
+                # Checkpoint: everything written so far survives a crash and is skipped on resume
+                out.flush()
+                os.fsync(out.fileno())
+
+                elapsed = time.perf_counter() - start
+                logger.info(f"{stats['cases']} cases, {stats['cases'] / elapsed:.2f} cases/s")
+        stats["elapsed_s"] = time.perf_counter() - start
+        return stats
+
+
+def build_assistant():
+    from dotenv import load_dotenv
+    from diagnosis_pipeline.load_models import load_models
+    from diagnosis_pipeline.medical_assistant import MedicalAssistant
+    from diagnosis_pipeline.model_server import ModelClient
+    from diagnosis_pipeline.retriever import open_pinecone_index
+    from diagnosis_pipeline.knowledge_index import KnowledgeIndex, openai_embedder
+
+    load_dotenv()
+    model_client = None
+    if os.getenv("USE_MODEL_SERVER") == "1":
+        model_client = ModelClient()
+        tokenizer = model = gen_tokenizer = gen_model = None
+    else:
+        tokenizer, model, gen_tokenizer, gen_model = load_models()
+    openai_api_key = os.getenv("OPENAI_API_KEY")
+    return MedicalAssistant(
+        tokenizer=tokenizer,
+        model=model,
+        gen_tokenizer=gen_tokenizer,
+        gen_model=gen_model,
+        model_client=model_client,
+        disease_csv_path="data/disease_prediction_cleaned_deduplicated.csv",
+        openai_api_key=openai_api_key,
+        pinecone_index=open_pinecone_index(),
+        knowledge_store=KnowledgeIndex(embed_fn=openai_embedder(openai_api_key))
+    )
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Batch diagnosis over a CSV/JSONL case set")
+    parser.add_argument("cases", help="CSV or JSONL file of cases")
+    parser.add_argument("--output", required=True, help="JSONL results file; appended to and resumed from")
+    parser.add_argument("--batch-size", type=int, default=16, help="Cases per batched generate call")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent extraction/RAG calls")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--limit", type=int, help="Stop after this many new cases")
+    parser.add_argument("--id-field", default="id")
+    parser.add_argument("--text-field", default="text")
+    parser.add_argument("--symptoms-field", default="symptoms")
+    parser.add_argument("--expected-field", default="expected")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+
+    truncate_partial_line(args.output)
+    done = load_done(args.output)
+    if done:
+        logger.info(f"Resuming: {len(done)} cases already in {args.output}")
+    cases = (c for c in iter_cases(args.cases) if str(c[args.id_field]) not in done)
+    if args.limit:
+        cases = islice(cases, args.limit)
+
+    diagnoser = BatchDiagnoser(build_assistant(), args)
+    with open(args.output, "a", encoding="utf-8") as out:
+        stats = diagnoser.run(cases, out)
+    diagnoser.pool.shutdown()
+
+    n = stats["cases"]
+    print(f"Cases:        {n} ({stats['complete']} with a diagnosis)")
+    print(f"Elapsed:      {stats['elapsed_s']:.1f}s")
+    print(f"Throughput:   {n / stats['elapsed_s']:.2f} cases/s" if n else "Throughput:   -")
+    if stats["expected"]:
+        print(f"Top-1 acc:    {stats['top1'] / stats['expected']:.1%} (of {stats['expected']} labeled)")
+        print(f"Top-{args.top_k} acc:    {stats['topk'] / stats['expected']:.1%}")
+
+
+if __name__ == "__main__":
+    main()
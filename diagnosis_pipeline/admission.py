@@ -0,0 +1,190 @@
+import heapq
+import itertools
+import logging
+import math
+import os
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+from diagnosis_pipeline.deadline import current_deadline
+
+logger = logging.getLogger(__name__)
+
+ADMISSION_MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", "1"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "16"))
+ADMISSION_MAX_WAIT_SECONDS = float(os.getenv("ADMISSION_MAX_WAIT_SECONDS", "8"))
+
+# Lower value is served first
+PRIORITY_FOLLOWUP = 0
+PRIORITY_NEW = 1
+PRIORITY_SPECULATIVE = 2
+PRIORITY_NAMES = {PRIORITY_FOLLOWUP: "followup", PRIORITY_NEW: "new", PRIORITY_SPECULATIVE: "speculative"}
+
+
+class Overloaded(RuntimeError):
+    """Raised instead of queueing work that could not be served in time."""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(f"Server overloaded ({reason}); retry in {retry_after:.1f}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ("priority", "enqueued", "event", "admitted", "shed")
+
+    def __init__(self, priority: int):
+        self.priority = priority
+        self.enqueued = time.monotonic()
+        self.event = threading.Event()
+        self.admitted = False
+        self.shed: Optional[Overloaded] = None
+
+
+class AdmissionController:
+    """Bounded priority queue in front of the GPU-bound prediction stage.
+
+    At most ``max_concurrent`` callers hold a slot; up to ``max_queue`` more wait,
+    ordered by priority then arrival. A caller is shed straight away with
+    ``Overloaded`` when the estimated wait (queue position x EWMA service time)
+    exceeds what it can afford: ``max_wait`` or, inside a request, whatever the
+    deadline leaves after the service time itself. A full queue evicts its
+    lowest-priority waiter in favour of a more important arrival.
+    """
+
+    def __init__(self, max_concurrent: int = ADMISSION_MAX_CONCURRENT, max_queue: int = ADMISSION_MAX_QUEUE,
+                 max_wait: float = ADMISSION_MAX_WAIT_SECONDS, initial_service_time: float = 1.0,
+                 alpha: float = 0.2):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.service_time = initial_service_time
+        self.alpha = alpha
+        self._lock = threading.Lock()
+        self._heap: List[tuple] = []
+        self._seq = itertools.count()
+        self._active = 0
+        self._admitted: Counter = Counter()
+        self._shed: Counter = Counter()
+        self._waits: deque = deque(maxlen=2048)
+
+    def _budget(self, timeout: Optional[float]) -> float:
+        budget = self.max_wait if timeout is None else timeout
+        deadline = current_deadline()
+        if deadline is not None:
+            # Admission is pointless if the work would finish after the request gave up
+            budget = min(budget, deadline.remaining() - self.service_time)
+        return max(0.0, budget)
+
+    def _estimated_wait(self, priority: int) -> float:
+        ahead = sum(1 for entry in self._heap if entry[0] <= priority)
+        return (ahead + 1) * self.service_time / self.max_concurrent
+
+    def _reject(self, priority: int, reason: str, retry_after: float) -> Overloaded:
+        self._shed[f"{PRIORITY_NAMES.get(priority, priority)}:{reason}"] += 1
+        return Overloaded(reason, max(retry_after, self.service_time))
+
+    def _enqueue(self, priority: int, budget: float) -> Optional[_Waiter]:
+        """Take a free slot (returns None), queue a waiter, or raise Overloaded."""
+        with self._lock:
+            if self._active < self.max_concurrent and not self._heap:
+                self._active += 1
+                self._record_admission(priority, 0.0)
+                return None
+
+            estimate = self._estimated_wait(priority)
+            if estimate > budget:
+                raise self._reject(priority, "latency", estimate)
+
+            if len(self._heap) >= self.max_queue:
+                worst = max(self._heap)
+                if worst[0] <= priority:
+                    raise self._reject(priority, "queue_full", estimate)
+                self._heap.remove(worst)
+                heapq.heapify(self._heap)
+                evicted = worst[2]
+                evicted.shed = self._reject(evicted.priority, "evicted", estimate)
+                evicted.event.set()
+
+            waiter = _Waiter(priority)
+            heapq.heappush(self._heap, (priority, next(self._seq), waiter))
+            return waiter
+
+    def _record_admission(self, priority: int, waited: float):
+        self._admitted[PRIORITY_NAMES.get(priority, priority)] += 1
+        self._waits.append(waited)
+
+    def _wait(self, waiter: _Waiter, budget: float):
+        waiter.event.wait(budget)
+        with self._lock:
+            if waiter.admitted:
+                return
+            if waiter.shed is None:
+                # Timed out still queued: leave the queue rather than hold a slot we can't use
+                self._heap = [entry for entry in self._heap if entry[2] is not waiter]
+                heapq.heapify(self._heap)
+                waiter.shed = self._reject(waiter.priority, "timeout", self._estimated_wait(waiter.priority))
+        raise waiter.shed
+
+    def _release(self, service_seconds: float):
+        with self._lock:
+            self.service_time += self.alpha * (service_seconds - self.service_time)
+            self._active -= 1
+            if self._heap:
+                _, _, waiter = heapq.heappop(self._heap)
+                waiter.admitted = True
+                self._active += 1
+                self._record_admission(waiter.priority, time.monotonic() - waiter.enqueued)
+                waiter.event.set()
+
+    def check(self, priority: int = PRIORITY_NEW, timeout: Optional[float] = None):
+        """Raise ``Overloaded`` if ``admit`` would shed this priority right now, without
+        taking a slot, so a request is turned away before its upstream stages run."""
+        budget = self._budget(timeout)
+        with self._lock:
+            if self._active < self.max_concurrent and not self._heap:
+                return
+            estimate = self._estimated_wait(priority)
+            if estimate > budget:
+                raise self._reject(priority, "latency", estimate)
+            if len(self._heap) >= self.max_queue and max(self._heap)[0] <= priority:
+                raise self._reject(priority, "queue_full", estimate)
+
+    @contextmanager
+    def admit(self, priority: int = PRIORITY_NEW, timeout: Optional[float] = None):
+        """Hold a prediction slot for the duration of the block.
+
+        ``timeout=0`` only runs when a slot is free right now (used for speculation).
+        """
+        budget = self._budget(timeout)
+        waiter = self._enqueue(priority, budget)
+        if waiter is not None:
+            self._wait(waiter, budget)
+
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(time.monotonic() - start)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            waits = sorted(self._waits)
+            depth = Counter(PRIORITY_NAMES.get(entry[0], entry[0]) for entry in self._heap)
+            return {
+                "active": self._active,
+                "max_concurrent": self.max_concurrent,
+                "queue_depth": len(self._heap),
+                "queue_depth_by_priority": dict(depth),
+                "max_queue": self.max_queue,
+                "service_time_ms": round(self.service_time * 1000, 1),
+                "admitted": dict(self._admitted),
+                "shed": dict(self._shed),
+                "wait_ms": {
+                    f"p{p}": round(waits[min(len(waits) - 1, math.ceil(p / 100 * len(waits)) - 1)] * 1000, 1)
+                    for p in (50, 95, 99)
+                } if waits else {},
+            }
@@ -0,0 +1,52 @@
+import re
+from typing import Optional
+
+AFFIRMATIVE = [
+    "yes", "yeah", "yep", "yup", "ya", "sure", "definitely", "absolutely", "of course",
+    "correct", "right", "indeed", "i do", "i am", "i have", "i think so", "a little",
+    "a bit", "a little bit", "somewhat", "sometimes", "kind of", "sort of", "slightly",
+    "mildly", "occasionally", "a lot", "often",
+]
+NEGATIVE = [
+    "no", "nope", "nah", "not really", "not at all", "never", "none", "not that i know",
+    "i don't", "i do not", "i dont", "i'm not", "i am not", "im not", "i haven't",
+    "i have not", "don't think so", "dont think so", "not that i noticed",
+]
+# Words that may surround a yes/no without adding information
+FILLER = {
+    "i", "it", "that", "so", "think", "guess", "maybe", "um", "uh", "well", "oh", "ok",
+    "okay", "just", "very", "really", "quite", "feel", "been", "too", "have", "do", "am",
+    "doctor", "thanks", "thank", "you", "actually", "honestly", "any", "anything", "like",
+}
+
+
+def _pattern(phrases):
+    alternatives = sorted((re.escape(p) for p in phrases), key=len, reverse=True)
+    return re.compile(r"\b(?:" + "|".join(alternatives) + r")\b")
+
+
+_AFFIRMATIVE_RE = _pattern(AFFIRMATIVE)
+_NEGATIVE_RE = _pattern(NEGATIVE)
+
+
+def parse_yes_no(text: str, max_words: int = 8) -> Optional[bool]:
+    """Resolve a short reply to a yes/no question.
+
+    Returns True/False for simple affirmations or negations, and None when the
+    reply is mixed, long, or carries extra content that needs the LLM to interpret.
+    """
+    normalized = re.sub(r"[^\w\s']", " ", text.lower()).strip()
+    if not normalized or len(normalized.split()) > max_words:
+        return None
+
+    # Negations first so "not really" is not read as a bare "really"
+    negative = bool(_NEGATIVE_RE.search(normalized))
+    remainder = _NEGATIVE_RE.sub(" ", normalized)
+    affirmative = bool(_AFFIRMATIVE_RE.search(remainder))
+    remainder = _AFFIRMATIVE_RE.sub(" ", remainder)
+
+    if negative == affirmative:
+        return None
+    if any(word not in FILLER for word in remainder.split()):
+        return None
+    return affirmative
@@ -0,0 +1,105 @@
+# diagnosis_pipeline/api.py
+
+import hmac
+import math
+from typing import Optional
+from fastapi import FastAPI, Header, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse
+from pydantic import BaseModel
+
+from diagnosis_pipeline.admission import AdmissionController, Overloaded
+from diagnosis_pipeline.deadline import Deadline
+from diagnosis_pipeline.profiling import ADMIN_TOKEN, PROFILER
+from diagnosis_pipeline.intent_classifier import IntentClassifier
+from diagnosis_pipeline.session_orchestrator import SessionOrchestrator
+from diagnosis_pipeline.session_store import SessionStore
+from diagnosis_pipeline.speculative import SpeculativeExecutor
+
+
+class Query(BaseModel):
+    message: str
+    session_id: str = "default"
+
+
+class ProfileRequest(BaseModel):
+    requests: int = 10
+    interval_ms: float = 5.0
+    torch: bool = False
+
+
+def create_app(assistant, session_store: SessionStore,
+               speculator: Optional[SpeculativeExecutor] = None,
+               intent_classifier: Optional[IntentClassifier] = None,
+               admission: Optional[AdmissionController] = None) -> FastAPI:
+    """Build the chat API around an assistant (real or stubbed, e.g. for load tests)."""
+    app = FastAPI()
+
+    def require_admin(token: Optional[str]):
+        # Admin routes do not exist unless ADMIN_TOKEN is configured
+        if not ADMIN_TOKEN:
+            raise HTTPException(status_code=404)
+        if not token or not hmac.compare_digest(token, ADMIN_TOKEN):
+            raise HTTPException(status_code=403, detail="Invalid admin token")
+
+    @app.get("/health")
+    def health():
+        return {"status": "ok"}
+
+    @app.post("/chat")
+    def chat_handler(query: Query):
+        deadline = Deadline()
+        session = SessionOrchestrator(
+            assistant,
+            speculator=speculator,
+            store=session_store,
+            session_id=query.session_id,
+            intent_classifier=intent_classifier,
+            admission=admission
+        )
+        try:
+            with PROFILER.request():
+                reply = session.handle(query.message, deadline=deadline)
+        except Overloaded as e:
+            # Shed fast; the turn was not applied, so the client can resend the same message
+            return JSONResponse(
+                status_code=429,
+                content={"detail": str(e), "session_id": query.session_id},
+                headers={"Retry-After": str(math.ceil(e.retry_after))}
+            )
+        return {
+            "response": reply,
+            "session_id": query.session_id,
+            "metadata": {
+                "elapsed_ms": round(deadline.elapsed_ms()),
+                "degraded": deadline.degradations
+            }
+        }
+
+    @app.get("/metrics")
+    def metrics():
+        return {"admission": admission.metrics() if admission else None}
+
+    @app.post("/admin/profile")
+    def start_profile(request: ProfileRequest, x_admin_token: Optional[str] = Header(None)):
+        """Profile the next N /chat requests; results land in PROFILE_DIR."""
+        require_admin(x_admin_token)
+        try:
+            capture = PROFILER.arm(request.requests, request.interval_ms, torch_profile=request.torch)
+        except RuntimeError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        return capture.report()
+
+    @app.get("/admin/profile")
+    def profile_status(format: str = "json", x_admin_token: Optional[str] = Header(None)):
+        """Latest capture: per-stage breakdown as JSON, or ``format=folded`` for flamegraph tools."""
+        require_admin(x_admin_token)
+        capture = PROFILER.last
+        if capture is None:
+            raise HTTPException(status_code=404, detail="No profile captured yet")
+        if format == "folded":
+            if not capture.finished:
+                raise HTTPException(status_code=409, detail=f"Capture {capture.id} still in progress")
+            return PlainTextResponse(capture.folded())
+        return capture.report()
+
+    return app
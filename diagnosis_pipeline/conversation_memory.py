@@ -0,0 +1,187 @@
+import logging
+import threading
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SESSION = "default"
+
+_active_session: ContextVar[str] = ContextVar("conversation_session", default=DEFAULT_SESSION)
+
+
+def approx_token_count(text: str) -> int:
+    """Cheap token estimate (~0.75 words per token) used when no tokenizer is supplied."""
+    return max(1, int(len(text.split()) / 0.75))
+
+
+def _render(message: Any) -> str:
+    """LangChain message objects to the ``Human: ...`` / ``AI: ...`` strings ConversationMemory stores."""
+    if isinstance(message, str):
+        return message
+    role = "Human" if getattr(message, "type", "") == "human" else "AI"
+    return f"{role}: {getattr(message, 'content', message)}"
+
+
+def memory_window(memory, max_messages: Optional[int] = None, max_tokens: Optional[int] = None,
+                  include_summary: bool = False) -> List[str]:
+    """Recent history from any memory object.
+
+    ConversationMemory serves a bounded window directly; other memories (e.g. an
+    injected LangChain memory) fall back to ``load_memory_variables`` and are trimmed
+    by message count only.
+    """
+    if isinstance(memory, ConversationMemory):
+        return memory.window(max_messages=max_messages, max_tokens=max_tokens, include_summary=include_summary)
+    variables = memory.load_memory_variables({})
+    history = variables.get(getattr(memory, "memory_key", "chat_history"), [])
+    if isinstance(history, str):
+        history = [line for line in history.splitlines() if line.strip()]
+    messages = [_render(m) for m in history]
+    return messages[-max_messages:] if max_messages else messages
+
+
+def record_exchange(memory, question: str, answer: str):
+    """Save an assistant question and the patient's answer in speaking order.
+
+    ``save_context`` pairs are (human input, AI output), which would file the
+    question as the patient's words; append the two turns individually instead.
+    """
+    if isinstance(memory, ConversationMemory):
+        memory.append(f"AI: {question}")
+        memory.append(f"Human: {answer}")
+    elif hasattr(memory, "chat_memory"):
+        memory.chat_memory.add_ai_message(question)
+        memory.chat_memory.add_user_message(answer)
+    else:
+        # Pair-only memories: keep the roles right and the question as context for the answer
+        memory.save_context({"input": f"{answer} (answering: {question})"}, {"output": ""})
+
+
+class _SessionBuffer:
+    def __init__(self, max_messages: int):
+        # (rendered message, token count)
+        self.messages: Deque[Tuple[str, int]] = deque(maxlen=max_messages)
+        self.summary: str = ""
+        self.evicted: int = 0
+
+
+class ConversationMemory:
+    """Per-session ring buffers with windowed reads by message count or token budget.
+
+    Drop-in for the ``save_context`` / ``load_memory_variables`` calls the agents make,
+    but appends are O(1) and a session never holds more than ``max_messages`` entries.
+    Evicted messages are folded into a short rolling summary.
+    """
+    memory_key = "chat_history"
+
+    def __init__(self, max_messages: int = 40, max_sessions: int = 1000,
+                 token_counter: Optional[Callable[[str], int]] = None,
+                 summarizer: Optional[Callable[[str, str], str]] = None,
+                 max_summary_chars: int = 1000):
+        self.max_messages = max_messages
+        self.max_sessions = max_sessions
+        self.token_counter = token_counter or approx_token_count
+        self.summarizer = summarizer
+        self.max_summary_chars = max_summary_chars
+        self._sessions: "OrderedDict[str, _SessionBuffer]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def session_id(self) -> str:
+        return _active_session.get()
+
+    @contextmanager
+    def session(self, session_id: str):
+        """Route reads and writes in this context to ``session_id``."""
+        token = _active_session.set(session_id)
+        try:
+            yield self
+        finally:
+            _active_session.reset(token)
+
+    def _buffer(self, session_id: Optional[str] = None) -> _SessionBuffer:
+        session_id = session_id or self.session_id
+        buf = self._sessions.get(session_id)
+        if buf is None:
+            buf = self._sessions[session_id] = _SessionBuffer(self.max_messages)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        else:
+            self._sessions.move_to_end(session_id)
+        return buf
+
+    def _fold(self, buf: _SessionBuffer, message: str):
+        """Fold an evicted message into the session's rolling summary."""
+        buf.evicted += 1
+        if self.summarizer:
+            try:
+                buf.summary = self.summarizer(buf.summary, message)[-self.max_summary_chars:]
+                return
+            except Exception as e:
+                logger.warning(f"[ConversationMemory] Summarizer failed: {e}")
+        snippet = message if len(message) <= 120 else message[:117] + "..."
+        buf.summary = f"{buf.summary} | {snippet}" if buf.summary else snippet
+        if len(buf.summary) > self.max_summary_chars:
+            buf.summary = buf.summary[-self.max_summary_chars:]
+
+    def append(self, message: str, session_id: Optional[str] = None):
+        with self._lock:
+            buf = self._buffer(session_id)
+            if len(buf.messages) == buf.messages.maxlen:
+                self._fold(buf, buf.messages[0][0])
+            buf.messages.append((message, self.token_counter(message)))
+
+    def save_context(self, inputs: Dict[str, Any], outputs: Dict[str, Any]):
+        self.append(f"Human: {inputs.get('input', '')}")
+        self.append(f"AI: {outputs.get('output', '')}")
+
+    def window(self, max_messages: Optional[int] = None, max_tokens: Optional[int] = None,
+               include_summary: bool = False, session_id: Optional[str] = None) -> List[str]:
+        """Most recent messages, oldest first, bounded by count and/or token budget."""
+        with self._lock:
+            buf = self._buffer(session_id)
+            selected: List[str] = []
+            used = 0
+            for message, tokens in reversed(buf.messages):
+                if max_messages is not None and len(selected) >= max_messages:
+                    break
+                if max_tokens is not None and used + tokens > max_tokens:
+                    break
+                selected.append(message)
+                used += tokens
+            selected.reverse()
+            if include_summary and buf.summary:
+                selected.insert(0, f"Earlier ({buf.evicted} messages): {buf.summary}")
+            return selected
+
+    def load_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, List[str]]:
+        return {self.memory_key: self.window()}
+
+    def export_session(self, session_id: Optional[str] = None) -> Dict[str, Any]:
+        with self._lock:
+            buf = self._buffer(session_id)
+            return {
+                "messages": [m for m, _ in buf.messages],
+                "summary": buf.summary,
+                "evicted": buf.evicted,
+            }
+
+    def import_session(self, data: Dict[str, Any], session_id: Optional[str] = None):
+        """Replace a session's buffer with previously exported state."""
+        with self._lock:
+            buf = _SessionBuffer(self.max_messages)
+            buf.messages.extend((m, self.token_counter(m)) for m in data.get("messages", []))
+            buf.summary = data.get("summary", "")
+            buf.evicted = data.get("evicted", 0)
+            key = session_id or self.session_id
+            self._sessions[key] = buf
+            self._sessions.move_to_end(key)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def clear(self, session_id: Optional[str] = None):
+        with self._lock:
+            self._sessions.pop(session_id or self.session_id, None)
@@ -0,0 +1,86 @@
+import logging
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "12"))
+
+# Minimum remaining budget (seconds) a stage needs before it is attempted;
+# below that the stage falls back to its degraded path.
+STAGE_BUDGETS: Dict[str, float] = {
+    "extract": 1.0,
+    "icd": 0.5,
+    "rag": 1.5,
+    "query_embedding": 0.5,
+    "followup": 2.0,
+    "evidence": 1.0,
+    "reasoning": 6.0,
+    "reasoning_summary": 1.5,
+    "precautions": 1.5,
+}
+
+_current: ContextVar[Optional["Deadline"]] = ContextVar("request_deadline", default=None)
+
+
+class Deadline:
+    """Per-request time budget shared by every agent call made while it is active."""
+
+    def __init__(self, seconds: float = REQUEST_DEADLINE_SECONDS):
+        self.seconds = seconds
+        self.started = time.monotonic()
+        self.expires = self.started + seconds
+        self.degradations: List[Dict[str, object]] = []
+
+    def remaining(self) -> float:
+        return self.expires - time.monotonic()
+
+    def elapsed_ms(self) -> float:
+        return (time.monotonic() - self.started) * 1000
+
+    def allows(self, stage: str) -> bool:
+        return self.remaining() >= STAGE_BUDGETS.get(stage, 0.0)
+
+    def timeout(self, default: float) -> float:
+        """Network timeout for a call: the smaller of default and what is left."""
+        return max(0.1, min(default, self.remaining()))
+
+    def degrade(self, stage: str, fallback: str):
+        self.degradations.append({
+            "stage": stage,
+            "fallback": fallback,
+            "remaining_ms": round(self.remaining() * 1000)
+        })
+        logger.info(f"[Deadline] {stage} degraded to {fallback} ({self.remaining():.2f}s left)")
+
+    @contextmanager
+    def activate(self):
+        token = _current.set(self)
+        try:
+            yield self
+        finally:
+            _current.reset(token)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current.get()
+
+
+def stage_allowed(stage: str) -> bool:
+    """True when no deadline is active or enough budget remains for the stage."""
+    deadline = _current.get()
+    return deadline is None or deadline.allows(stage)
+
+
+def stage_timeout(default: float) -> float:
+    deadline = _current.get()
+    return deadline.timeout(default) if deadline else default
+
+
+def record_degradation(stage: str, fallback: str):
+    deadline = _current.get()
+    if deadline:
+        deadline.degrade(stage, fallback)
@@ -1,61 +1,109 @@
 import torch
 import logging
-from typing import List, Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Tuple
 from diagnosis_pipeline.icd_mapper import ICD10Mapper
+from diagnosis_pipeline.profiling import PROFILER
 
 logger = logging.getLogger(__name__)
 
+def build_prompt(symptoms: List[str]) -> str:
+    return f"### Symptoms:\n{', '.join(symptoms)}\n\n### Diagnosis:\n"
+
+
+def generate_candidates(tokenizer, model, symptom_lists: List[List[str]], top_k: int = 5) -> List[List[Tuple[str, float]]]:
+    """Beam-search disease names for several symptom lists in one batched generate call."""
+    model.set_adapter("diagnosis")  # Activate adapter if using PEFT
+    tokenizer.padding_side = "left"  # decoder-only batching needs left padding
+
+    prompts = [build_prompt(symptoms) for symptoms in symptom_lists]
+    inputs = tokenizer(prompts, return_tensors="pt", padding=True).to(model.device)
+
+    with torch.no_grad():
+        outputs = model.generate(
+            **inputs,
+            max_new_tokens=32,
+            num_beams=max(5, top_k),
+            num_return_sequences=top_k,
+            early_stopping=True,
+            output_scores=True,
+            return_dict_in_generate=True
+        )
+
+    results: List[List[Tuple[str, float]]] = [[] for _ in prompts]
+    if hasattr(outputs, 'sequences_scores'):
+        for i, (seq, score) in enumerate(zip(outputs.sequences, outputs.sequences_scores)):
+            decoded = tokenizer.decode(seq, skip_special_tokens=True)
+            disease_name = decoded.split("### Diagnosis:")[-1].strip().lower()
+            disease_name = disease_name.split('\n')[0].strip()
+            results[i // top_k].append((disease_name, torch.exp(score).item()))
+    return results
+
+
 class DiseasePredictor:
-    def __init__(self, tokenizer, model, icd_mapper: ICD10Mapper, fine_db):
+    def __init__(self, tokenizer, model, icd_mapper: ICD10Mapper, fine_db, model_client=None):
         self.tokenizer = tokenizer
         self.model = model
         self.icd_mapper = icd_mapper
         self.fine_db = fine_db
+        # When set, generation runs in the shared model server instead of this process
+        self.model_client = model_client
 
-    def predict(self, symptoms: List[str], top_k: int = 5) -> List[Dict]:
-        """Predict diseases using fine-tuned LLM and map ICD-10 codes."""
-        self.model.set_adapter("diagnosis")  # Activate adapter if using PEFT
+    def _to_predictions(self, candidates: List[Tuple[str, float]]) -> List[Dict]:
+        """Map generated disease names to ICD-10 codes, local DB first."""
+        predictions = []
+        for disease_name, confidence in candidates:
+            local_match = self.fine_db[
+                self.fine_db["disease"].str.lower() == disease_name
+            ]
+            if not local_match.empty:
+                icd_code = local_match.iloc[0]["ICD-10 Code"]
+            else:
+                code_map = self.icd_mapper.get_codes(disease_name)
+                icd_code = code_map.get(disease_name, "Unknown")
+
+            predictions.append({
+                "disease": disease_name,
+                "icd10": icd_code,
+                "confidence": confidence
+            })
 
-        prompt = f"### Symptoms:\n{', '.join(symptoms)}\n\n### Diagnosis:\n"
-        inputs = self.tokenizer(prompt, return_tensors="pt").to(self.model.device)
+        return sorted(predictions, key=lambda x: x["confidence"], reverse=True)
 
+    def predict(self, symptoms: List[str], top_k: int = 5) -> List[Dict]:
+        """Predict diseases using fine-tuned LLM and map ICD-10 codes."""
         try:
-            with torch.no_grad():
-                outputs = self.model.generate(
-                    **inputs,
-                    max_new_tokens=32,
-                    num_beams=5,
-                    num_return_sequences=top_k,
-                    early_stopping=True,
-                    output_scores=True,
-                    return_dict_in_generate=True
-                )
-
-            predictions = []
-            if hasattr(outputs, 'sequences_scores'):
-                for seq, score in zip(outputs.sequences, outputs.sequences_scores):
-                    decoded = self.tokenizer.decode(seq, skip_special_tokens=True)
-                    disease_name = decoded.split("### Diagnosis:")[-1].strip().lower()
-                    disease_name = disease_name.split('\n')[0].strip()
-
-                    local_match = self.fine_db[
-                        self.fine_db["disease"].str.lower() == disease_name
-                    ]
-                    if not local_match.empty:
-                        icd_code = local_match.iloc[0]["ICD-10 Code"]
-                    else:
-                        code_map = self.icd_mapper.get_codes(disease_name)
-                        icd_code = code_map.get(disease_name, "Unknown")
-
-                    confidence = torch.exp(score).item()
-                    predictions.append({
-                        "disease": disease_name,
-                        "icd10": icd_code,
-                        "confidence": confidence
-                    })
-
-            return sorted(predictions, key=lambda x: x["confidence"], reverse=True)
+            with PROFILER.torch_stage("disease_generate"):
+                if self.model_client:
+                    candidates = self.model_client.predict(symptoms, top_k=top_k)
+                else:
+                    candidates = generate_candidates(self.tokenizer, self.model, [symptoms], top_k)[0]
+            return self._to_predictions(candidates)
 
         except Exception as e:
             logger.error(f"[DiseasePredictor] Prediction failed: {e}")
-            return []
\ No newline at end of file
+            return []
+
+    def predict_batch(self, symptom_lists: List[List[str]], top_k: int = 5) -> List[List[Dict]]:
+        """Predict for many cases with one generate call; a failed batch falls back to
+        per-case prediction, and a failed ICD mapping empties only its own case."""
+        if not symptom_lists:
+            return []
+        if self.model_client:
+            # The model server micro-batches concurrent requests, so send them concurrently
+            with ThreadPoolExecutor(max_workers=min(len(symptom_lists), 16)) as pool:
+                return list(pool.map(lambda symptoms: self.predict(symptoms, top_k), symptom_lists))
+        try:
+            with PROFILER.torch_stage("disease_generate_batch"):
+                batch = generate_candidates(self.tokenizer, self.model, symptom_lists, top_k)
+        except Exception as e:
+            logger.error(f"[DiseasePredictor] Batch of {len(symptom_lists)} failed, retrying per case: {e}")
+            return [self.predict(symptoms, top_k) for symptoms in symptom_lists]
+        results = []
+        for symptoms, candidates in zip(symptom_lists, batch):
+            try:
+                results.append(self._to_predictions(candidates))
+            except Exception as e:
+                logger.error(f"[DiseasePredictor] Mapping predictions for {symptoms} failed: {e}")
+                results.append([])
+        return results
@@ -1,6 +1,9 @@
 import logging
 from typing import List, Dict, Set, Optional
 from openai import OpenAI
+from diagnosis_pipeline.deadline import stage_allowed, stage_timeout, record_degradation
+from diagnosis_pipeline.symptom_vocab import VOCAB
+from diagnosis_pipeline.conversation_memory import memory_window
 
 logger = logging.getLogger(__name__)
 
@@ -12,20 +15,27 @@ QUESTION_DIMS = [
 ]
 
 class FollowupGenerator:
-    def __init__(self, openai_api_key: str, cooc_matrix, memory, max_followups: int = 3):
-        self.client = OpenAI(api_key=openai_api_key)
+    def __init__(self, openai_api_key: str, cooc_matrix, memory, max_followups: int = 3, client=None):
+        self.client = client or OpenAI(api_key=openai_api_key)
         self.cooc = cooc_matrix
         self.memory = memory
         self.max_followups = max_followups
 
     def generate(self, symptoms: List[str], predictions: List[Dict], asked_dims: Set[str],
-                 patient_profile: Dict = None, last_user_input: str = "") -> List[str]:
+                 patient_profile: Dict = None, last_user_input: str = "",
+                 targets: Optional[List[str]] = None,
+                 ruled_out: Optional[List[str]] = None) -> List[str]:
+        """Generate the next follow-up question. If ``targets`` is given, it is filled with
+        the candidate symptoms a missing-symptom question asks about; symptoms in
+        ``ruled_out`` (already denied by the patient) are never asked about again."""
 
-        context = self.memory.load_memory_variables({"input": last_user_input})["chat_history"]
-        context_str = "\n".join(f"- {m}" for m in context[-3:]) if context else "No previous context"
+        context = memory_window(self.memory, max_messages=3)
+        context_str = "\n".join(f"- {m}" for m in context) if context else "No previous context"
 
         confidence = predictions[0]['confidence'] if predictions else 0.0
-        remaining_dims = [d for d in QUESTION_DIMS if d not in asked_dims]
+        # Without a co-occurrence matrix there are no candidate symptoms to ask about
+        remaining_dims = [d for d in QUESTION_DIMS
+                          if d not in asked_dims and (self.cooc is not None or d != "missing_symptoms")]
         if not remaining_dims:
             return []
 
@@ -34,15 +44,18 @@ class FollowupGenerator:
 
         if current_dim == "missing_symptoms":
             suspected = [p["disease"] for p in predictions[:3]]
-            if confidence > 0.8:
-                missing = self.cooc.top_candidates(symptoms, suspected, k=1)
-            elif confidence > 0.5:
-                missing = self.cooc.top_candidates(symptoms, suspected, k=2)
-            else:
-                missing = self.cooc.top_candidates(symptoms, suspected, k=3)
+            k = 1 if confidence > 0.8 else 2 if confidence > 0.5 else 3
+            ruled_out = ruled_out or []
+            # Over-fetch so denied symptoms don't leave the question short of candidates
+            missing = self.cooc.top_candidates(symptoms, suspected, k=k + len(ruled_out))
 
+            # Never ask about something the patient already reported or denied under another spelling
+            known = set(VOCAB.encode(symptoms)) | set(VOCAB.encode(ruled_out))
+            missing = VOCAB.decode(i for i in VOCAB.encode(missing) if i not in known)[:k]
             if not missing:
                 return []
+            if targets is not None:
+                targets.extend(missing)
 
             if confidence > 0.8:
                 prompt = f"""Context: {context_str}
@@ -69,6 +82,12 @@ Conversation History:
 Ask one follow-up question about the patient's {current_dim.replace('_', ' ')},
 tailored to the confidence level ({'high' if confidence > 0.8 else 'medium' if confidence > 0.5 else 'low'}):"""
 
+        if not stage_allowed("followup"):
+            record_degradation("followup", "template_question")
+            if current_dim == "missing_symptoms":
+                return [f"Are you experiencing {missing[0]}?"]
+            return [f"Can you tell me more about your {current_dim.replace('_', ' ')}?"]
+
         try:
             response = self.client.chat.completions.create(
                 model="gpt-4",
@@ -76,7 +95,8 @@ tailored to the confidence level ({'high' if confidence > 0.8 else 'medium' if c
                     {"role": "system", "content": "You are a caring medical assistant. Use direct patient-friendly language."},
                     {"role": "user", "content": prompt}
                 ],
-                temperature=0.7
+                temperature=0.7,
+                timeout=stage_timeout(20)
             )
             return [response.choices[0].message.content.strip()]
         except Exception as e:
@@ -0,0 +1,154 @@
+import csv
+import logging
+import math
+import os
+import re
+from array import array
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+ICD10_CODES_PATH = os.getenv("ICD10_CODES_PATH", "data/icd10cm_codes.txt")
+STOPWORDS = {"of", "the", "and", "or", "due", "to", "with", "without", "in", "by", "for", "other", "unspecified"}
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", re.sub(r"[^a-z0-9 ]", " ", text.lower())).strip()
+
+
+def _tokens(text: str) -> List[str]:
+    return [t for t in _normalize(text).split() if t not in STOPWORDS]
+
+
+def _trigrams(text: str) -> set:
+    padded = f"  {_normalize(text)} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def format_code(code: str) -> str:
+    """CMS files list codes without the dot (A000); ICD-10 writes them as A00.0."""
+    code = code.strip().upper()
+    return code if "." in code or len(code) <= 3 else f"{code[:3]}.{code[3:]}"
+
+
+class ICD10Index:
+    """Offline ICD-10 code/title search using token and trigram inverted indexes.
+
+    Token postings give IDF-weighted word overlap; trigram postings catch typos
+    and spelling variants. Both are compact ``array('I')`` posting lists.
+    """
+
+    def __init__(self, entries: List[Tuple[str, str]], min_score: float = 0.4):
+        self.codes: List[str] = []
+        self.titles: List[str] = []
+        self.exact: Dict[str, int] = {}
+        self.title_gram_counts = array("H")
+        self.min_score = min_score
+        token_postings: Dict[str, List[int]] = defaultdict(list)
+        trigram_postings: Dict[str, List[int]] = defaultdict(list)
+
+        for doc, (code, title) in enumerate(entries):
+            self.codes.append(format_code(code))
+            self.titles.append(title)
+            self.exact.setdefault(_normalize(title), doc)
+            for token in set(_tokens(title)):
+                token_postings[token].append(doc)
+            grams = _trigrams(title)
+            self.title_gram_counts.append(min(len(grams), 65535))
+            for gram in grams:
+                trigram_postings[gram].append(doc)
+
+        n = max(1, len(self.codes))
+        self.token_postings = {t: array("I", docs) for t, docs in token_postings.items()}
+        self.trigram_postings = {g: array("I", docs) for g, docs in trigram_postings.items()}
+        self.idf = {t: math.log(1 + n / len(docs)) for t, docs in token_postings.items()}
+        # Trigram index over the token vocabulary, used to correct misspelled query words
+        vocab_grams: Dict[str, List[str]] = defaultdict(list)
+        for token in self.token_postings:
+            for gram in _trigrams(token):
+                vocab_grams[gram].append(token)
+        self.vocab_grams = dict(vocab_grams)
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    @classmethod
+    def from_file(cls, path: str = ICD10_CODES_PATH, **kwargs) -> "ICD10Index":
+        """Load CMS-style ``CODE<spaces>Title`` text files or CSV/TSV files with code and title columns."""
+        entries: List[Tuple[str, str]] = []
+        with open(path, encoding="utf-8") as f:
+            if path.endswith((".csv", ".tsv")):
+                reader = csv.DictReader(f, delimiter="\t" if path.endswith(".tsv") else ",")
+                fields = {name.lower(): name for name in reader.fieldnames or []}
+                code_col = next(fields[k] for k in ("code", "icd-10 code", "icd10") if k in fields)
+                title_col = next(fields[k] for k in ("title", "description", "disease", "name") if k in fields)
+                entries = [(row[code_col], row[title_col]) for row in reader if row[code_col]]
+            else:
+                for line in f:
+                    parts = line.strip().split(None, 1)
+                    if len(parts) == 2:
+                        entries.append((parts[0], parts[1]))
+        logger.info(f"[ICD10Index] Loaded {len(entries)} codes from {path}")
+        return cls(entries, **kwargs)
+
+    def _correct(self, token: str, min_similarity: float = 0.5) -> Optional[Tuple[str, float]]:
+        """Closest vocabulary word by trigram Jaccard similarity, if similar enough."""
+        grams = _trigrams(token)
+        hits: Counter = Counter()
+        for gram in grams:
+            hits.update(self.vocab_grams.get(gram, ()))
+        best, best_sim = None, 0.0
+        for candidate, shared in hits.most_common(20):
+            sim = shared / (len(grams) + len(_trigrams(candidate)) - shared)
+            if sim > best_sim:
+                best, best_sim = candidate, sim
+        return (best, best_sim) if best and best_sim >= min_similarity else None
+
+    def search(self, query: str, k: int = 5, max_candidates: int = 200) -> List[Tuple[str, str, float]]:
+        """Ranked (code, title, score) matches, score in [0, 1]."""
+        normalized = _normalize(query)
+        if normalized in self.exact:
+            doc = self.exact[normalized]
+            return [(self.codes[doc], self.titles[doc], 1.0)]
+
+        # Map each query word to a vocabulary word (itself, or a spelling correction)
+        weighted_tokens: Dict[str, float] = {}
+        unmatched_idf = 0.0
+        for token in set(_tokens(query)):
+            if token in self.idf:
+                weighted_tokens[token] = 1.0
+            elif corrected := self._correct(token):
+                weighted_tokens[corrected[0]] = corrected[1]
+            else:
+                unmatched_idf += math.log(1 + len(self.codes))
+        total_idf = sum(self.idf[t] for t in weighted_tokens) + unmatched_idf or 1.0
+
+        token_score: Dict[int, float] = defaultdict(float)
+        for token, weight in weighted_tokens.items():
+            for doc in self.token_postings[token]:
+                token_score[doc] += weight * self.idf[token] / total_idf
+
+        query_grams = _trigrams(query)
+
+        gram_hits: Counter = Counter()
+        for gram in query_grams:
+            gram_hits.update(self.trigram_postings.get(gram, ()))
+
+        candidates = set(sorted(token_score, key=token_score.get, reverse=True)[:max_candidates])
+        candidates.update(doc for doc, _ in gram_hits.most_common(max_candidates))
+
+        scored = []
+        for doc in candidates:
+            jaccard = gram_hits[doc] / (len(query_grams) + self.title_gram_counts[doc] - gram_hits[doc])
+            score = 0.75 * token_score.get(doc, 0.0) + 0.25 * jaccard
+            scored.append((score, doc))
+        scored.sort(reverse=True)
+        return [(self.codes[d], self.titles[d], round(s, 4)) for s, d in scored[:k]]
+
+    def lookup(self, disease: str) -> Optional[str]:
+        """Best code for a disease name, or None if nothing scores above min_score."""
+        matches = self.search(disease, k=1)
+        if matches and matches[0][2] >= self.min_score:
+            return matches[0][0]
+        return None
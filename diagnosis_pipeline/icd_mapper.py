@@ -1,14 +1,30 @@
 import requests
 from datetime import datetime, timedelta
 import logging
-from typing import Union, List, Dict
+import os
+from typing import Union, List, Dict, Optional
+from diagnosis_pipeline.deadline import stage_allowed, stage_timeout, record_degradation
+from diagnosis_pipeline.icd10_index import ICD10Index, ICD10_CODES_PATH
 
 logger = logging.getLogger(__name__)
 
 class ICD10Mapper:
-    def __init__(self, client_id: str, client_secret: str):
+    def __init__(self, client_id: str, client_secret: str,
+                 offline_index: Optional[ICD10Index] = None, online_fallback: bool = True):
         self.client_id = client_id
         self.client_secret = client_secret
+        # Local ICD-10 index is authoritative; the WHO API (which serves ICD-11 MMS
+        # codes) is only consulted for names the index cannot resolve.
+        if offline_index is None and os.path.exists(ICD10_CODES_PATH):
+            offline_index = ICD10Index.from_file(ICD10_CODES_PATH)
+        self.offline_index = offline_index
+        self.has_credentials = bool(client_id and client_secret)
+        self.online_fallback = online_fallback and self.has_credentials
+        if offline_index is None and not self.online_fallback:
+            raise FileNotFoundError(
+                f"No ICD-10 code source: {ICD10_CODES_PATH} does not exist and the WHO API is "
+                f"{'disabled' if not online_fallback else 'missing ICD_CLIENT_ID/ICD_CLIENT_SECRET'}"
+            )
         self.token = None
         self.expiry = None
         self.cache = {}
@@ -33,7 +49,7 @@ class ICD10Mapper:
                     "grant_type": "client_credentials",
                     "scope": "icdapi_access"
                 },
-                timeout=5
+                timeout=stage_timeout(5)
             )
             response.raise_for_status()
             token_data = response.json()
@@ -58,12 +74,45 @@ class ICD10Mapper:
             else:
                 uncached.append(disease)
 
+        if self.offline_index:
+            unresolved = []
+            for disease in uncached:
+                code = self.offline_index.lookup(disease)
+                if code:
+                    self.cache[disease.lower()] = code
+                    results[disease] = code
+                else:
+                    unresolved.append(disease)
+            uncached = unresolved
+
         if not uncached:
             return results
 
-        self._refresh_token()
+        if not self.online_fallback:
+            for disease in uncached:
+                # An index miss is final only when offline mode was chosen; without
+                # credentials, leave it uncached so the mapper answers correctly once they exist
+                if self.has_credentials:
+                    self.cache[disease.lower()] = "Not_Found"
+                results[disease] = "Not_Found"
+            return results
+
+        # Out of time budget: answer "Unknown" without caching so a later request retries
+        if not stage_allowed("icd"):
+            record_degradation("icd", "unknown_code")
+            results.update({disease: "Unknown" for disease in uncached})
+            return results
+
+        try:
+            self._refresh_token()
+        except ConnectionError as e:
+            logger.warning(f"[ICD10Mapper] {e}")
+            record_degradation("icd", "unknown_code")
+            results.update({disease: "Unknown" for disease in uncached})
+            return results
 
         for disease in uncached:
+            transient = False
             try:
                 response = requests.get(
                     "https://id.who.int/icd/release/11/2022-02/mms/search",
@@ -73,7 +122,7 @@ class ICD10Mapper:
                         "flatResults": "true",
                         "useFlexisearch": "true"
                     },
-                    timeout=5
+                    timeout=stage_timeout(5)
                 )
                 if response.status_code == 200:
                     data = response.json()
@@ -83,10 +132,14 @@ class ICD10Mapper:
                         code = "Not_Found"
                 else:
                     code = f"API_Error_{response.status_code}"
+                    transient = True
             except Exception as e:
                 code = f"Lookup_Error: {str(e)}"
+                transient = True
 
-            self.cache[disease.lower()] = code
+            # Failed lookups are answered but not cached, so a later request retries them
+            if not transient:
+                self.cache[disease.lower()] = code
             results[disease] = code
 
         return results
@@ -0,0 +1,179 @@
+import json
+import logging
+import math
+import os
+import random
+import re
+import zlib
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+INTENT_MODEL_PATH = os.getenv("INTENT_MODEL_PATH", "intent_model.json")
+INTENT_EXAMPLES_PATH = os.getenv("INTENT_EXAMPLES_PATH", "data/intent_examples.jsonl")
+INTENT_CONFIDENCE_THRESHOLD = float(os.getenv("INTENT_CONFIDENCE_THRESHOLD", "0.75"))
+LABELS = ["symptom_diagnosis", "patient_history", "chat"]
+N_BUCKETS = 1 << 18
+
+SEED_EXAMPLES: List[Tuple[str, str]] = [
+    ("I have a headache and fever since yesterday", "symptom_diagnosis"),
+    ("My throat hurts and I keep coughing", "symptom_diagnosis"),
+    ("I've been feeling dizzy and nauseous all morning", "symptom_diagnosis"),
+    ("There is a sharp pain in my lower back", "symptom_diagnosis"),
+    ("I have a rash on my arm that itches", "symptom_diagnosis"),
+    ("My stomach hurts after eating and I have diarrhea", "symptom_diagnosis"),
+    ("I feel tired all the time and have trouble breathing", "symptom_diagnosis"),
+    ("my chest feels tight and my heart is racing", "symptom_diagnosis"),
+    ("I have a runny nose, sneezing and watery eyes", "symptom_diagnosis"),
+    ("what could be causing my joint pain and swelling", "symptom_diagnosis"),
+    ("I've had a fever of 39 for three days", "symptom_diagnosis"),
+    ("I keep vomiting and can't keep food down", "symptom_diagnosis"),
+    ("my knee is swollen and hurts when I walk", "symptom_diagnosis"),
+    ("I have blurry vision and frequent urination", "symptom_diagnosis"),
+    ("can you diagnose my symptoms, I have chills and body aches", "symptom_diagnosis"),
+    ("I was diagnosed with diabetes five years ago", "patient_history"),
+    ("I have a history of high blood pressure", "patient_history"),
+    ("I take metformin and lisinopril every day", "patient_history"),
+    ("I had surgery on my appendix last year", "patient_history"),
+    ("My mother had breast cancer", "patient_history"),
+    ("I'm allergic to penicillin", "patient_history"),
+    ("I had asthma as a child", "patient_history"),
+    ("what medications am I currently on", "patient_history"),
+    ("show me my previous diagnoses", "patient_history"),
+    ("I've been a smoker for 10 years", "patient_history"),
+    ("my father has a history of heart disease", "patient_history"),
+    ("update my medical records with my new prescription", "patient_history"),
+    ("I was hospitalized for pneumonia in 2019", "patient_history"),
+    ("what did we discuss about my history last time", "patient_history"),
+    ("I got my flu vaccine last month", "patient_history"),
+    ("hello", "chat"),
+    ("hi there, how are you?", "chat"),
+    ("thanks for your help", "chat"),
+    ("good morning", "chat"),
+    ("who are you?", "chat"),
+    ("what can you do", "chat"),
+    ("thank you, bye", "chat"),
+    ("ok sounds good", "chat"),
+    ("tell me a joke", "chat"),
+    ("how does this chatbot work", "chat"),
+    ("nice to meet you", "chat"),
+    ("what is the weather like today", "chat"),
+    ("can I talk to a human", "chat"),
+    ("that's all for now", "chat"),
+    ("great, appreciate it", "chat"),
+]
+
+
+def _bucket(feature: str) -> int:
+    # crc32 is stable across processes, unlike the salted built-in hash()
+    return zlib.crc32(feature.encode("utf-8")) & (N_BUCKETS - 1)
+
+
+def featurize(text: str) -> Dict[int, float]:
+    """Hashed word uni/bigrams and character trigrams, L2-normalized."""
+    words = re.findall(r"[a-z0-9']+", text.lower())
+    counts: Dict[int, float] = {}
+    features = [f"w:{w}" for w in words]
+    features += [f"b:{a}_{b}" for a, b in zip(words, words[1:])]
+    for w in words:
+        padded = f"^{w}$"
+        features += [f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2)]
+    for feature in features:
+        idx = _bucket(feature)
+        counts[idx] = counts.get(idx, 0.0) + 1.0
+    norm = math.sqrt(sum(v * v for v in counts.values())) or 1.0
+    return {k: v / norm for k, v in counts.items()}
+
+
+class IntentClassifier:
+    """Hashed n-gram multinomial logistic regression for routing messages on-box.
+
+    ``predict`` returns a label and its probability; callers escalate to the LLM
+    classifier when the probability is below ``threshold``.
+    """
+
+    def __init__(self, labels: Optional[List[str]] = None, threshold: float = INTENT_CONFIDENCE_THRESHOLD):
+        self.labels = labels or list(LABELS)
+        self.threshold = threshold
+        self.weights: Dict[int, List[float]] = {}
+        self.bias: List[float] = [0.0] * len(self.labels)
+
+    def _scores(self, features: Dict[int, float]) -> List[float]:
+        scores = list(self.bias)
+        for idx, value in features.items():
+            w = self.weights.get(idx)
+            if w is not None:
+                for c in range(len(scores)):
+                    scores[c] += w[c] * value
+        top = max(scores)
+        exps = [math.exp(s - top) for s in scores]
+        total = sum(exps)
+        return [e / total for e in exps]
+
+    def predict(self, text: str) -> Tuple[str, float]:
+        probs = self._scores(featurize(text))
+        best = max(range(len(probs)), key=probs.__getitem__)
+        return self.labels[best], probs[best]
+
+    def train(self, examples: Iterable[Tuple[str, str]], epochs: int = 30,
+              lr: float = 0.5, l2: float = 1e-4, seed: int = 13) -> "IntentClassifier":
+        data = [(featurize(text), self.labels.index(label)) for text, label in examples]
+        rng = random.Random(seed)
+        n_classes = len(self.labels)
+        for epoch in range(epochs):
+            rng.shuffle(data)
+            step = lr / (1 + epoch * 0.1)
+            for features, target in data:
+                probs = self._scores(features)
+                for c in range(n_classes):
+                    grad = probs[c] - (1.0 if c == target else 0.0)
+                    self.bias[c] -= step * grad
+                    for idx, value in features.items():
+                        w = self.weights.setdefault(idx, [0.0] * n_classes)
+                        w[c] -= step * (grad * value + l2 * w[c])
+        return self
+
+    def save(self, path: str = INTENT_MODEL_PATH):
+        with open(path, "w") as f:
+            json.dump({
+                "labels": self.labels,
+                "threshold": self.threshold,
+                "bias": self.bias,
+                "weights": {str(k): v for k, v in self.weights.items()},
+            }, f)
+
+    @classmethod
+    def load(cls, path: str = INTENT_MODEL_PATH) -> "IntentClassifier":
+        with open(path) as f:
+            data = json.load(f)
+        clf = cls(labels=data["labels"], threshold=data.get("threshold", INTENT_CONFIDENCE_THRESHOLD))
+        clf.bias = data["bias"]
+        clf.weights = {int(k): v for k, v in data["weights"].items()}
+        return clf
+
+    @classmethod
+    def load_or_train(cls, path: str = INTENT_MODEL_PATH,
+                      examples_path: str = INTENT_EXAMPLES_PATH) -> "IntentClassifier":
+        """Load a trained model if present, otherwise fit one on the labeled examples
+        (falling back to the built-in seed examples, which escalate most traffic)."""
+        if os.path.exists(path):
+            return cls.load(path)
+        if os.path.exists(examples_path):
+            examples = load_examples(examples_path) + SEED_EXAMPLES
+            logger.info(f"[IntentClassifier] No trained model found; training on {len(examples)} examples")
+            return cls().train(examples)
+        logger.warning(f"[IntentClassifier] Neither {path} nor {examples_path} found; training on seed examples")
+        return cls().train(SEED_EXAMPLES)
+
+
+def parse_intent(content: str) -> Optional[str]:
+    """The single intent label named in an LLM reply, or None if it names none or several."""
+    text = re.sub(r"[\s-]+", "_", content.strip().lower())
+    found = [label for label in LABELS if label in text]
+    return found[0] if len(found) == 1 else None
+
+
+def load_examples(path: str) -> List[Tuple[str, str]]:
+    """Read labeled examples from JSONL lines of the form {"text": ..., "label": ...}."""
+    with open(path, encoding="utf-8") as f:
+        return [(r["text"], r["label"]) for r in map(json.loads, f) if r.get("text")]
@@ -0,0 +1,310 @@
+import fcntl
+import json
+import logging
+import math
+import os
+import re
+import threading
+from collections import Counter, OrderedDict, defaultdict
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+
+from diagnosis_pipeline.deadline import record_degradation, stage_allowed, stage_timeout
+
+logger = logging.getLogger(__name__)
+
+KNOWLEDGE_INDEX_DIR = os.getenv("KNOWLEDGE_INDEX_DIR", "knowledge_index")
+RRF_K = 60
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "in", "is", "it",
+    "of", "on", "or", "that", "the", "to", "was", "were", "with", "this", "these", "we"
+}
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in re.findall(r"[a-z0-9]+", text.lower()) if t not in STOPWORDS]
+
+
+def openai_embedder(openai_api_key: str, model: str = "text-embedding-ada-002",
+                    client=None) -> Callable[[List[str]], List[List[float]]]:
+    """Batch embedding function backed by the OpenAI embeddings endpoint."""
+    if client is None:
+        from openai import OpenAI
+        client = OpenAI(api_key=openai_api_key)
+
+    def embed(texts: List[str]) -> List[List[float]]:
+        resp = client.embeddings.create(model=model, input=texts, timeout=stage_timeout(30))
+        return [d.embedding for d in resp.data]
+
+    return embed
+
+
+class KnowledgeDocument:
+    """Search hit with the same ``page_content`` / ``metadata`` shape as a LangChain Document."""
+
+    def __init__(self, page_content: str, metadata: Optional[Dict] = None, doc_id: str = ""):
+        self.page_content = page_content
+        self.metadata = metadata or {}
+        self.id = doc_id
+
+
+class KnowledgeIndex:
+    """Local hybrid knowledge store: BM25 over an inverted index fused (RRF) with
+    cosine search over a memory-mapped float32 embedding matrix.
+
+    Exposes ``add_texts`` and ``similarity_search`` so it can stand in for the
+    external vector store used by MedicalRetriever and ReasoningGenerator.
+
+    Several processes may share one directory: writers serialize on an flock and
+    write vectors before the docs that reference them, and every process picks up
+    documents appended by the others before writing or searching.
+    """
+
+    def __init__(self, directory: str = KNOWLEDGE_INDEX_DIR,
+                 embed_fn: Optional[Callable[[List[str]], List[List[float]]]] = None,
+                 k1: float = 1.5, b: float = 0.75, cache_size: int = 256):
+        self.directory = directory
+        self.embed_fn = embed_fn
+        self.k1 = k1
+        self.b = b
+        self.cache_size = cache_size
+        self._docs_path = os.path.join(directory, "docs.jsonl")
+        self._vectors_path = os.path.join(directory, "embeddings.f32")
+        self._meta_path = os.path.join(directory, "meta.json")
+        self._lock_path = os.path.join(directory, ".lock")
+        self._docs_offset = 0
+        self._lock = threading.RLock()
+        self._cache: "OrderedDict[Tuple[str, int], List[KnowledgeDocument]]" = OrderedDict()
+
+        self.ids: List[str] = []
+        self.texts: List[str] = []
+        self.metadatas: List[Dict] = []
+        self.id_to_doc: Dict[str, int] = {}
+        self.postings: Dict[str, Dict[int, int]] = defaultdict(dict)
+        self.doc_lengths: List[int] = []
+        self.total_length = 0
+        self.row_to_doc: List[int] = []
+        self.dim: Optional[int] = None
+        self._matrix: Optional[np.ndarray] = None
+
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @contextmanager
+    def _file_lock(self):
+        """Exclusive lock on the index directory, shared by every process using it."""
+        with open(self._lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _load(self):
+        with self._lock, self._file_lock():
+            self._catch_up()
+
+    def _vector_rows_on_disk(self) -> int:
+        if not self.dim or not os.path.exists(self._vectors_path):
+            return 0
+        return os.path.getsize(self._vectors_path) // (self.dim * 4)
+
+    def _docs_changed(self) -> bool:
+        return os.path.exists(self._docs_path) and os.path.getsize(self._docs_path) != self._docs_offset
+
+    def _catch_up(self):
+        """Index records appended since the last read and repair a torn tail.
+
+        Must hold both locks. A record whose vector row is missing (a crash between
+        the two writes) and anything after it is truncated away; so are vectors no
+        record references and a partially written last line. The affected documents
+        were never acknowledged, so re-ingesting them is safe.
+        """
+        if self.dim is None and os.path.exists(self._meta_path):
+            with open(self._meta_path) as f:
+                self.dim = json.load(f).get("dim")
+
+        if os.path.exists(self._docs_path):
+            available = self._vector_rows_on_disk()
+            with open(self._docs_path, "rb") as f:
+                f.seek(self._docs_offset)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    record = json.loads(line)
+                    row = record.get("row", -1)
+                    if row >= 0 and (row != len(self.row_to_doc) or row >= available):
+                        logger.warning(f"[KnowledgeIndex] Dropping documents from {record['id']} on: "
+                                       f"vector row {row} missing")
+                        break
+                    self._docs_offset += len(line)
+                    doc = self._index_document(record["id"], record["text"], record.get("metadata", {}))
+                    if row >= 0:
+                        self.row_to_doc.append(doc)
+            if os.path.getsize(self._docs_path) > self._docs_offset:
+                os.truncate(self._docs_path, self._docs_offset)
+
+        if self.dim and self._vector_rows_on_disk() > len(self.row_to_doc):
+            os.truncate(self._vectors_path, len(self.row_to_doc) * self.dim * 4)
+        self._cache.clear()
+        self._remap()
+
+    def _remap(self):
+        """(Re)open the embedding matrix as a read-only memory map."""
+        rows = len(self.row_to_doc)
+        if rows and self.dim:
+            self._matrix = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dim))
+        else:
+            self._matrix = None
+
+    def _index_document(self, doc_id: str, text: str, metadata: Dict) -> int:
+        doc = len(self.ids)
+        self.ids.append(doc_id)
+        self.texts.append(text)
+        self.metadatas.append(metadata)
+        self.id_to_doc[doc_id] = doc
+        tokens = tokenize(text)
+        for term, tf in Counter(tokens).items():
+            self.postings[term][doc] = tf
+        self.doc_lengths.append(len(tokens))
+        self.total_length += len(tokens)
+        return doc
+
+    def _embed(self, texts: List[str]) -> Optional[np.ndarray]:
+        if not self.embed_fn:
+            return None
+        try:
+            vectors = np.asarray(self.embed_fn(texts), dtype=np.float32)
+        except Exception as e:
+            logger.warning(f"[KnowledgeIndex] Embedding failed, falling back to BM25 only: {e}")
+            return None
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def add_texts(self, texts: List[str], metadatas: Optional[List[Dict]] = None,
+                  ids: Optional[List[str]] = None) -> List[str]:
+        """Append new documents; IDs already present are skipped so re-ingestion is idempotent."""
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [f"doc_{len(self.ids) + i}" for i in range(len(texts))]
+
+        with self._lock:
+            with self._file_lock():
+                self._catch_up()
+            candidates = [(i, t, m) for i, t, m in zip(ids, texts, metadatas) if i not in self.id_to_doc]
+            if not candidates:
+                return []
+            # Embed outside the file lock; other workers keep writing meanwhile
+            vectors = self._embed([t for _, t, _ in candidates])
+
+            with self._file_lock():
+                self._catch_up()
+                keep = [n for n, (doc_id, _, _) in enumerate(candidates) if doc_id not in self.id_to_doc]
+                new = [candidates[n] for n in keep]
+                if not new:
+                    return []
+                if vectors is not None:
+                    vectors = vectors[keep]
+                    if self.dim is None:
+                        self.dim = int(vectors.shape[1])
+                        with open(self._meta_path, "w") as f:
+                            json.dump({"dim": self.dim}, f)
+                    elif vectors.shape[1] != self.dim:
+                        logger.warning(f"[KnowledgeIndex] Embedding dim {vectors.shape[1]} != {self.dim}; "
+                                       f"skipping vectors")
+                        vectors = None
+
+                # Vectors first: a docs record must never point at a row that is not on disk
+                if vectors is not None:
+                    with open(self._vectors_path, "ab") as f:
+                        f.write(vectors.tobytes())
+                        f.flush()
+                        os.fsync(f.fileno())
+
+                with open(self._docs_path, "ab") as f:
+                    for n, (doc_id, text, metadata) in enumerate(new):
+                        row = len(self.row_to_doc) + n if vectors is not None else -1
+                        record = json.dumps({"id": doc_id, "text": text, "metadata": metadata, "row": row})
+                        f.write(record.encode("utf-8") + b"\n")
+                    f.flush()
+                    os.fsync(f.fileno())
+                    self._docs_offset = f.tell()
+
+            for doc_id, text, metadata in new:
+                doc = self._index_document(doc_id, text, metadata)
+                if vectors is not None:
+                    self.row_to_doc.append(doc)
+            self._remap()
+            self._cache.clear()
+            return [doc_id for doc_id, _, _ in new]
+
+    def clear_cache(self):
+        """Drop cached search results; the indexed documents are kept."""
+        with self._lock:
+            self._cache.clear()
+
+    def _bm25(self, query: str, limit: int) -> List[int]:
+        n_docs = len(self.ids)
+        avg_len = self.total_length / n_docs
+        scores: Dict[int, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc, tf in postings.items():
+                norm = tf + self.k1 * (1 - self.b + self.b * self.doc_lengths[doc] / avg_len)
+                scores[doc] += idf * tf * (self.k1 + 1) / norm
+        return sorted(scores, key=scores.get, reverse=True)[:limit]
+
+    def _vector(self, q: Optional[np.ndarray], limit: int) -> List[int]:
+        if self._matrix is None or q is None:
+            return []
+        sims = self._matrix @ q[0]
+        limit = min(limit, len(sims))
+        top = np.argpartition(-sims, limit - 1)[:limit]
+        return [self.row_to_doc[r] for r in top[np.argsort(-sims[top])]]
+
+    def similarity_search(self, query: str, k: int = 5) -> List[KnowledgeDocument]:
+        """Reciprocal-rank fusion of BM25 and vector rankings, cached per query."""
+        key = (query, k)
+        with self._lock:
+            if self._docs_changed():
+                # Another worker appended documents
+                with self._file_lock():
+                    self._catch_up()
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+            if not self.ids:
+                return []
+            has_vectors = self._matrix is not None
+
+        # Embed the query outside the lock; a remote embedder may be slow or offline
+        q = None
+        if has_vectors:
+            if stage_allowed("query_embedding"):
+                q = self._embed([query])
+            else:
+                record_degradation("query_embedding", "bm25_only")
+
+        with self._lock:
+            depth = max(k * 4, 20)
+            fused: Dict[int, float] = defaultdict(float)
+            for ranking in (self._bm25(query, depth), self._vector(q, depth)):
+                for rank, doc in enumerate(ranking):
+                    fused[doc] += 1.0 / (RRF_K + rank + 1)
+
+            top = sorted(fused, key=fused.get, reverse=True)[:k]
+            results = [KnowledgeDocument(self.texts[d], self.metadatas[d], self.ids[d]) for d in top]
+
+            if q is None and has_vectors:
+                # BM25-only fallback; don't pin it in the cache
+                return results
+            self._cache[key] = results
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            return results
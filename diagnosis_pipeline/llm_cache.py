@@ -0,0 +1,145 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "llm_cache.sqlite3")
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+DEFAULT_MAX_ENTRIES = 50_000
+# Transport options that do not change the response and so stay out of the key
+UNKEYED_PARAMS = {"timeout"}
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace for near-duplicate keys."""
+    text = re.sub(r"[^\w\s]", " ", text.lower())
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class LLMResponseCache:
+    """SQLite-backed cache for deterministic (temperature 0) chat completions.
+
+    The database runs in WAL mode so several worker processes can share one file.
+    """
+
+    def __init__(self, path: str = LLM_CACHE_PATH, ttl_seconds: int = DEFAULT_TTL_SECONDS,
+                 max_entries: int = DEFAULT_MAX_ENTRIES, normalize_keys: bool = False,
+                 evict_every: int = 100):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.normalize_keys = normalize_keys
+        self.evict_every = evict_every
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+    def _connection(self) -> sqlite3.Connection:
+        # Reconnect after fork: sqlite connections must not cross process boundaries
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False,
+                                   isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, model TEXT, content TEXT, "
+                "created_at REAL, accessed_at REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_accessed ON responses(accessed_at)")
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def make_key(self, model: str, messages: List[Dict[str, str]], **params: Any) -> str:
+        """Hash model, messages (system prompt included) and sampling params into a key."""
+        if self.normalize_keys:
+            messages = [{**m, "content": normalize_text(m.get("content", ""))} for m in messages]
+        params = {k: v for k, v in params.items() if k not in UNKEYED_PARAMS}
+        payload = json.dumps(
+            {"model": model, "messages": messages, "params": params},
+            sort_keys=True, ensure_ascii=False, separators=(",", ":")
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, model: str, messages: List[Dict[str, str]], **params: Any) -> Optional[str]:
+        key = self.make_key(model, messages, **params)
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._connection()
+                row = conn.execute(
+                    "SELECT content, created_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None or now - row[1] > self.ttl_seconds:
+                    self.misses += 1
+                    return None
+                conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+                self.hits += 1
+                return row[0]
+        except sqlite3.Error as e:
+            logger.warning(f"[LLMResponseCache] Read failed: {e}")
+            return None
+
+    def set(self, model: str, messages: List[Dict[str, str]], content: str, **params: Any):
+        key = self.make_key(model, messages, **params)
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._connection()
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, model, content, created_at, accessed_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (key, model, content, now, now)
+                )
+                self._writes += 1
+                if self._writes % self.evict_every == 0:
+                    self._evict(conn, now)
+        except sqlite3.Error as e:
+            logger.warning(f"[LLMResponseCache] Write failed: {e}")
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        """Drop expired rows, then least recently used rows above max_entries."""
+        conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,))
+        count = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow > 0:
+            conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY accessed_at ASC LIMIT ?)",
+                (overflow,)
+            )
+
+    def complete(self, client, model: str, messages: List[Dict[str, str]],
+                 validate: Optional[Callable[[str], bool]] = None, **params: Any) -> str:
+        """Return a chat completion, serving temperature-0 calls from the cache when possible.
+
+        With ``validate``, only replies it accepts are cached or served from the cache,
+        so a malformed reply is retried instead of replayed for the whole TTL.
+        """
+        cacheable = params.get("temperature", 1.0) == 0.0
+        if cacheable:
+            cached = self.get(model, messages, **params)
+            if cached is not None and (validate is None or validate(cached)):
+                return cached
+
+        response = client.chat.completions.create(model=model, messages=messages, **params)
+        content = response.choices[0].message.content.strip()
+
+        if cacheable and (validate is None or validate(content)):
+            self.set(model, messages, content, **params)
+        return content
+
+    def clear(self):
+        with self._lock:
+            self._connection().execute("DELETE FROM responses")
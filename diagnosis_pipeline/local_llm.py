@@ -0,0 +1,206 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from diagnosis_pipeline.deadline import stage_timeout
+from diagnosis_pipeline.llm_cache import LLMResponseCache
+from diagnosis_pipeline.profiling import PROFILER
+
+logger = logging.getLogger(__name__)
+
+LOCAL_MODEL_NAME = "local:Llama-3.2-1B-Instruct"
+LOCAL_TIMEOUT_SECONDS = float(os.getenv("LOCAL_TIMEOUT_SECONDS", "15"))
+
+# Which backend serves each task. Cheap, short-output tasks go to the resident
+# 1B model; multi-step clinical reasoning stays on the remote model.
+DEFAULT_ROUTES: Dict[str, str] = {
+    "symptom_extraction": "local",
+    "intent": "local",
+    "reasoning_summary": "local",
+    "chat": "local",
+    "patient_history": "local",
+    "reasoning": "openai",
+    "followup": "openai",
+    "answer_analysis": "openai",
+    "precautions": "openai",
+}
+MODEL_ROUTES: Dict[str, str] = {**DEFAULT_ROUTES, **json.loads(os.getenv("MODEL_ROUTES", "{}"))}
+
+
+def generate_chat_batch(tokenizer, model, conversations: List[List[Dict[str, str]]],
+                        max_new_tokens: int = 256, temperature: float = 0.3) -> List[str]:
+    """Run one padded generate call over several chat conversations."""
+    import torch
+
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    tokenizer.padding_side = "left"
+
+    prompts = [
+        tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+        for messages in conversations
+    ]
+    inputs = tokenizer(prompts, return_tensors="pt", padding=True, add_special_tokens=False).to(model.device)
+
+    with torch.no_grad():
+        outputs = model.generate(
+            **inputs,
+            max_new_tokens=max_new_tokens,
+            do_sample=temperature > 0,
+            temperature=temperature if temperature > 0 else None,
+            top_p=0.9 if temperature > 0 else None,
+            pad_token_id=tokenizer.pad_token_id
+        )
+
+    prompt_len = inputs["input_ids"].shape[1]
+    return [tokenizer.decode(out[prompt_len:], skip_special_tokens=True).strip() for out in outputs]
+
+
+class _Request:
+    def __init__(self, messages: List[Dict[str, str]], max_new_tokens: int, temperature: float):
+        self.messages = messages
+        self.max_new_tokens = max_new_tokens
+        self.temperature = temperature
+        self.result: Optional[str] = None
+        self.error: Optional[Exception] = None
+        self.done = threading.Event()
+        self.abandoned = False
+        # Profile capture of the request that queued this call, if it is being profiled
+        self.capture = PROFILER.active()
+
+
+class LocalGenerator:
+    """In-process generation on the resident chat model.
+
+    Concurrent ``generate`` calls that arrive within ``max_wait_ms`` of each other
+    are micro-batched into a single padded generate call. Beyond ``max_queue``
+    waiting requests, or after ``timeout`` seconds, ``generate`` fails so the router
+    sends the call to OpenAI.
+    """
+
+    def __init__(self, tokenizer, model, max_batch: int = 8, max_wait_ms: float = 10.0,
+                 max_queue: int = 32):
+        self.tokenizer = tokenizer
+        self.model = model
+        self.max_batch = max_batch
+        self.max_queue = max_queue
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: "queue.Queue[_Request]" = queue.Queue()
+        threading.Thread(target=self._batch_loop, daemon=True, name="local-llm-batcher").start()
+
+    def generate(self, messages: List[Dict[str, str]], max_new_tokens: int = 256,
+                 temperature: float = 0.3, timeout: Optional[float] = None) -> str:
+        if self._queue.qsize() >= self.max_queue:
+            raise RuntimeError(f"Local generation queue is full ({self.max_queue} waiting)")
+        request = _Request(messages, max_new_tokens, temperature)
+        self._queue.put(request)
+        if not request.done.wait(timeout):
+            # Still queued requests are skipped by the batcher; one mid-generate just finishes unread
+            request.abandoned = True
+            raise TimeoutError(f"Local generation did not finish within {timeout:.1f}s")
+        if request.error:
+            raise request.error
+        return request.result
+
+    def _collect_batch(self) -> List[_Request]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _batch_loop(self):
+        while True:
+            groups: Dict[Tuple[int, float], List[_Request]] = defaultdict(list)
+            for request in self._collect_batch():
+                if request.abandoned:
+                    continue
+                groups[(request.max_new_tokens, request.temperature)].append(request)
+
+            for (max_new_tokens, temperature), requests in groups.items():
+                capture = next((r.capture for r in requests if r.capture is not None), None)
+                try:
+                    with PROFILER.torch_stage("local_generate", capture):
+                        outputs = generate_chat_batch(
+                            self.tokenizer, self.model, [r.messages for r in requests],
+                            max_new_tokens=max_new_tokens, temperature=temperature
+                        )
+                    for request, output in zip(requests, outputs):
+                        request.result = output
+                except Exception as e:
+                    logger.error(f"[LocalGenerator] Batch of {len(requests)} failed: {e}")
+                    for request in requests:
+                        request.error = e
+                finally:
+                    for request in requests:
+                        request.done.set()
+
+
+class ModelRouter:
+    """Dispatches chat tasks to the local model or OpenAI according to MODEL_ROUTES.
+
+    ``local_backend`` is anything with ``generate(messages, max_new_tokens, temperature, timeout)``:
+    a LocalGenerator or a ModelClient talking to the shared model server. Local
+    failures and timeouts fall back to OpenAI so routing never reduces availability.
+    """
+
+    def __init__(self, openai_client, local_backend=None, routes: Optional[Dict[str, str]] = None,
+                 cache: Optional[LLMResponseCache] = None):
+        self.openai_client = openai_client
+        self.local_backend = local_backend
+        self.routes = routes or MODEL_ROUTES
+        self.cache = cache
+
+    def backend_for(self, task: str) -> str:
+        route = self.routes.get(task, "openai")
+        return "local" if route == "local" and self.local_backend is not None else "openai"
+
+    def complete(self, task: str, messages: List[Dict[str, str]], model: str,
+                 temperature: float = 0.0, max_new_tokens: int = 512,
+                 validate: Optional[Callable[[str], bool]] = None, **params) -> str:
+        """Return the completion text for a task; ``model`` names the OpenAI model used
+        when the task is routed (or falls back) remotely. ``validate`` decides which
+        replies may be cached."""
+        if self.backend_for(task) == "local":
+            try:
+                return self._local(messages, temperature, max_new_tokens,
+                                   stage_timeout(params.get("timeout", LOCAL_TIMEOUT_SECONDS)), validate)
+            except Exception as e:
+                logger.warning(f"[ModelRouter] Local {task} failed, falling back to {model}: {e}")
+                if "timeout" in params:
+                    # The local attempt spent part of the caller's budget
+                    params["timeout"] = stage_timeout(params["timeout"])
+
+        if self.cache:
+            return self.cache.complete(self.openai_client, model, messages, validate=validate,
+                                       temperature=temperature, **params)
+        response = self.openai_client.chat.completions.create(
+            model=model, messages=messages, temperature=temperature, **params
+        )
+        return response.choices[0].message.content.strip()
+
+    def _local(self, messages: List[Dict[str, str]], temperature: float, max_new_tokens: int,
+               timeout: float, validate: Optional[Callable[[str], bool]] = None) -> str:
+        cacheable = self.cache is not None and temperature == 0.0
+        if cacheable:
+            cached = self.cache.get(LOCAL_MODEL_NAME, messages, temperature=temperature,
+                                    max_new_tokens=max_new_tokens)
+            if cached is not None and (validate is None or validate(cached)):
+                return cached
+        content = self.local_backend.generate(messages, max_new_tokens=max_new_tokens, temperature=temperature,
+                                              timeout=timeout)
+        if cacheable and (validate is None or validate(content)):
+            self.cache.set(LOCAL_MODEL_NAME, messages, content, temperature=temperature,
+                           max_new_tokens=max_new_tokens)
+        return content
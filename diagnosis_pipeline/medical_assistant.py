@@ -9,6 +9,14 @@ from diagnosis_pipeline.retriever import MedicalRetriever
 from diagnosis_pipeline.followup_generator import FollowupGenerator
 from diagnosis_pipeline.reasoning import ReasoningGenerator
 from diagnosis_pipeline.utils import generate_fallback_reasoning
+from diagnosis_pipeline.llm_cache import LLMResponseCache
+from diagnosis_pipeline.conversation_memory import ConversationMemory, memory_window
+from diagnosis_pipeline.knowledge_index import KnowledgeIndex, openai_embedder
+from diagnosis_pipeline.local_llm import LocalGenerator, ModelRouter
+from diagnosis_pipeline.intent_classifier import parse_intent
+from diagnosis_pipeline.deadline import stage_timeout
+from diagnosis_pipeline.symptom_vocab import VOCAB
+from openai import OpenAI
 from fuzzywuzzy import fuzz
 from dotenv import load_dotenv
 import os
@@ -17,6 +25,8 @@ load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+DISEASE_META_CSV_PATH = os.getenv("DISEASE_META_CSV_PATH", "/content/drive/MyDrive/merged_diseases.csv")
+
 class MedicalAssistant:
     def __init__(self,
                  tokenizer,
@@ -28,13 +38,21 @@ class MedicalAssistant:
                  pinecone_index=None,
                  memory=None,
                  knowledge_store=None,
-                 cooc_matrix=None):
+                 cooc_matrix=None,
+                 llm_cache: Optional[LLMResponseCache] = None,
+                 model_client=None,
+                 openai_client=None,
+                 meta_csv_path: str = DISEASE_META_CSV_PATH):
 
-        # Load fine-tuned disease DB
+        # Load fine-tuned disease DB; its symptoms (and the metadata's) form the interned vocabulary
         self.fine_db = pd.read_csv(disease_csv_path)
-        self.fine_db['cleaned_symptoms'] = self.fine_db['cleaned_symptoms'].apply(ast.literal_eval)
-        self.meta_df = pd.read_csv("/content/drive/MyDrive/merged_diseases.csv")
+        self.fine_db['symptom_ids'] = self.fine_db.pop('cleaned_symptoms').map(
+            lambda raw: VOCAB.encode(ast.literal_eval(raw), intern=True)
+        )
+        self.meta_df = pd.read_csv(meta_csv_path)
         self.meta_df["combined_symptoms"] = self.meta_df["combined_symptoms"].apply(ast.literal_eval)
+        for symptoms in self.meta_df["combined_symptoms"]:
+            VOCAB.encode(symptoms, intern=True)
 
         # Core LLM components
         self.tokenizer = tokenizer
@@ -42,23 +60,164 @@ class MedicalAssistant:
         self.gen_tokenizer = gen_tokenizer
         self.gen_model = gen_model
         self.openai_api_key = openai_api_key
+        self.model_client = model_client
+        # One OpenAI client shared by every agent
+        openai_client = openai_client or OpenAI(api_key=openai_api_key)
+
+        # Shared deterministic-response cache for temperature-0 agent calls
+        self.llm_cache = llm_cache if llm_cache is not None else LLMResponseCache()
+
+        # Route cheap tasks to the resident 1B chat model (in-process or via the model server)
+        local_backend = model_client
+        if local_backend is None and gen_model is not None:
+            local_backend = LocalGenerator(gen_tokenizer, gen_model)
+        self.router = ModelRouter(openai_client, local_backend, cache=self.llm_cache)
+
+        # Bounded per-session conversation memory shared by all agents
+        memory = memory if memory is not None else ConversationMemory()
+
+        # Local hybrid BM25 + vector index for PubMed evidence when no external store is given
+        if knowledge_store is None:
+            knowledge_store = KnowledgeIndex(embed_fn=openai_embedder(openai_api_key, client=openai_client))
 
         # Submodules
         self.icd_mapper = ICD10Mapper(
             client_id=os.getenv("ICD_CLIENT_ID"),
             client_secret=os.getenv("ICD_CLIENT_SECRET")
         )
-        self.symptom_extractor = SymptomExtractor(openai_api_key)
-        self.predictor = DiseasePredictor(tokenizer, model, self.icd_mapper, self.fine_db)
-        self.retriever = MedicalRetriever(openai_api_key, pinecone_index, self.icd_mapper, knowledge_store)
-        self.followup_generator = FollowupGenerator(openai_api_key, cooc_matrix, memory)
-        self.reasoning_generator = ReasoningGenerator(openai_api_key, memory, knowledge_store)
+        self.symptom_extractor = SymptomExtractor(openai_api_key, cache=self.llm_cache, router=self.router,
+                                                  client=openai_client)
+        self.predictor = DiseasePredictor(tokenizer, model, self.icd_mapper, self.fine_db,
+                                          model_client=model_client)
+        self.retriever = MedicalRetriever(openai_api_key, pinecone_index, self.icd_mapper, knowledge_store,
+                                          client=openai_client)
+        self.followup_generator = FollowupGenerator(openai_api_key, cooc_matrix, memory, client=openai_client)
+        self.reasoning_generator = ReasoningGenerator(openai_api_key, memory, knowledge_store, router=self.router,
+                                                      client=openai_client)
 
         # Memory + store
         self.memory = memory
         self.pinecone_index = pinecone_index
         self.knowledge_store = knowledge_store
 
+    def generate_followups(self, symptoms: List[str], predictions: List[Dict], asked_dims: Set[str],
+                           patient_profile: Optional[Dict[str, Any]] = None, last_user_input: str = "",
+                           targets: Optional[List[str]] = None,
+                           ruled_out: Optional[List[str]] = None) -> List[str]:
+        return self.followup_generator.generate(
+            symptoms, predictions, asked_dims, patient_profile, last_user_input,
+            targets=targets, ruled_out=ruled_out
+        )
+
+    # ───────── Pipeline steps used by SessionOrchestrator ─────────
+
+    def extract_symptoms(self, text: str) -> List[str]:
+        return self.symptom_extractor.extract(text)
+
+    def analyze_response(self, question: str, answer: str) -> Dict[str, List[str]]:
+        """Symptoms confirmed by a free-form answer to a follow-up question."""
+        return {"new_symptoms": self.symptom_extractor.extract_from_answer(question, answer)}
+
+    def classify_intent(self, text: str) -> str:
+        """LLM intent routing for messages the local classifier is unsure about."""
+        messages = [
+            {"role": "system", "content": (
+                "Classify the user's message to a medical assistant. Reply with exactly one label: "
+                "symptom_diagnosis (they describe symptoms or ask what might be wrong), "
+                "patient_history (they share or ask about past conditions, medications, allergies "
+                "or family history), or chat (anything else)."
+            )},
+            {"role": "user", "content": text}
+        ]
+        try:
+            content = self.router.complete("intent", messages, model="gpt-3.5-turbo", temperature=0.0,
+                                           max_new_tokens=8, validate=lambda c: parse_intent(c) is not None,
+                                           timeout=stage_timeout(10))
+            return parse_intent(content) or "chat"
+        except Exception as e:
+            logger.error(f"[MedicalAssistant] Intent classification failed: {e}")
+            return "chat"
+
+    def rag_lookup(self, symptoms: List[str], top_k: int = 5) -> List[Dict]:
+        return self.retriever.rag_lookup(symptoms, top_k=top_k)
+
+    def predict_diseases(self, symptoms: List[str], top_k: int = 5) -> List[Dict]:
+        return self.predictor.predict(symptoms, top_k=top_k)
+
+    def evaluate_predictions(self, rag_preds: List[Dict], llm_preds: List[Dict],
+                             symptoms: List[str]) -> List[Dict]:
+        return self.combine_predictions(rag_preds, llm_preds)
+
+    def generate_reasoning(self, symptoms: List[str], diagnosis: Dict, patient_profile: Optional[Dict[str, Any]],
+                           last_user_input: str = "") -> Dict[str, str]:
+        return self.reasoning_generator.generate(symptoms, diagnosis, patient_profile, last_user_input)
+
+    def generate_precautions(self, disease: str, treatment: Any) -> str:
+        messages = [
+            {"role": "system", "content": (
+                "You are a caring medical assistant. Give 3-5 short, practical precautions a patient "
+                "can take at home. Do not prescribe medication."
+            )},
+            {"role": "user", "content": f"Condition: {disease}\nUsual treatment: {treatment}\n\nPrecautions:"}
+        ]
+        try:
+            return self.router.complete("precautions", messages, model="gpt-3.5-turbo", temperature=0.3,
+                                        max_new_tokens=200, timeout=stage_timeout(15))
+        except Exception as e:
+            logger.error(f"[MedicalAssistant] Precautions failed: {e}")
+            return f"Please consult your doctor about precautions for {disease}."
+
+    def clear_memory(self):
+        """Forget the active session's conversation."""
+        self.memory.clear()
+
+    def clear_knowledge(self):
+        """Drop cached evidence lookups; the indexed corpus is shared by every session and stays."""
+        clear_cache = getattr(self.knowledge_store, "clear_cache", None)
+        if clear_cache:
+            clear_cache()
+
+    def _converse(self, task: str, system_prompt: str, text: str) -> str:
+        messages = [
+            {"role": "system", "content": system_prompt},
+            *[{"role": "user" if m.startswith("Human: ") else "assistant", "content": m.split(": ", 1)[-1]}
+              for m in memory_window(self.memory, max_messages=4)],
+            {"role": "user", "content": text}
+        ]
+        try:
+            reply = self.router.complete(task, messages, model="gpt-3.5-turbo", temperature=0.7,
+                                         max_new_tokens=200, timeout=stage_timeout(15))
+        except Exception as e:
+            logger.error(f"[MedicalAssistant] {task} failed: {e}")
+            reply = "Sorry, I couldn't process that. Could you rephrase?"
+        self.memory.save_context({"input": text}, {"output": reply})
+        return reply
+
+    def handle_chat(self, text: str) -> str:
+        """Small talk outside a diagnosis, answered by the routed chat backend."""
+        return self._converse("chat", (
+            "You are a friendly medical assistant chatbot. Keep replies short. "
+            "If the user describes symptoms, invite them to share details for a diagnosis."
+        ), text)
+
+    def handle_patient_history(self, text: str) -> str:
+        """Acknowledge medical history; saved to memory, it informs later reasoning prompts."""
+        return self._converse("patient_history", (
+            "You are a medical assistant taking the patient's history. Briefly acknowledge what they "
+            "share about past conditions, medications, allergies or family history, or answer from "
+            "the conversation if they ask about it. Do not diagnose."
+        ), text)
+
+    @staticmethod
+    def combine_predictions(rag_preds: List[Dict], llm_preds: List[Dict]) -> List[Dict]:
+        """Merge RAG and model predictions by ICD-10 code, keeping the most confident."""
+        combined = {}
+        for pred in rag_preds + llm_preds:
+            key = pred["icd10"]
+            if key not in combined or pred["confidence"] > combined[key]["confidence"]:
+                combined[key] = pred
+        return sorted(combined.values(), key=lambda x: x["confidence"], reverse=True)
+
     def run_diagnosis(self, user_input: str, patient_profile: Optional[Dict[str, Any]] = None) -> Dict:
         symptoms = self.symptom_extractor.extract(user_input)
         if not symptoms:
@@ -74,14 +233,7 @@ class MedicalAssistant:
             rag_preds = self.retriever.rag_lookup(symptoms)
             llm_preds = self.predictor.predict(symptoms)
 
-            # Combine by ICD-10 + fuzzy match
-            combined = {}
-            for pred in rag_preds + llm_preds:
-                key = pred["icd10"]
-                if key not in combined or pred["confidence"] > combined[key]["confidence"]:
-                    combined[key] = pred
-
-            final_preds = sorted(combined.values(), key=lambda x: x["confidence"], reverse=True)
+            final_preds = self.combine_predictions(rag_preds, llm_preds)
             top = final_preds[0] if final_preds else None
 
             if not top:
@@ -0,0 +1,217 @@
+# diagnosis_pipeline/model_server.py
+
+import os
+import queue
+import logging
+import secrets
+import threading
+import time
+from collections import defaultdict
+from multiprocessing.connection import Client, Connection, Listener
+from typing import Any, Dict, List, Optional, Tuple
+
+from diagnosis_pipeline.deadline import stage_timeout
+from diagnosis_pipeline.local_llm import generate_chat_batch
+
+logger = logging.getLogger(__name__)
+
+MODEL_SERVER_ADDRESS = os.getenv("MODEL_SERVER_ADDRESS", "/tmp/diagnosis-models.sock")
+# The transport pickles payloads, so the key is what stands between the socket and code execution.
+# Set MODEL_SERVER_AUTHKEY explicitly, or let the server generate one into a 0600 key file.
+MODEL_SERVER_AUTHKEY_FILE = os.getenv("MODEL_SERVER_AUTHKEY_FILE", MODEL_SERVER_ADDRESS + ".key")
+MODEL_SERVER_TIMEOUT = float(os.getenv("MODEL_SERVER_TIMEOUT", "60"))
+
+
+def load_authkey(create: bool = False, path: str = MODEL_SERVER_AUTHKEY_FILE) -> bytes:
+    """MODEL_SERVER_AUTHKEY if set, else the key file; the server may create the file."""
+    if key := os.getenv("MODEL_SERVER_AUTHKEY"):
+        return key.encode()
+    if os.path.exists(path):
+        st = os.stat(path)
+        if st.st_uid != os.getuid() or st.st_mode & 0o077:
+            raise RuntimeError(f"Refusing model server key {path}: must be owned by this user with mode 0600")
+        with open(path, "rb") as f:
+            return f.read().strip()
+    if not create:
+        raise RuntimeError(f"No model server key: set MODEL_SERVER_AUTHKEY or start the server to create {path}")
+    key = secrets.token_hex(32).encode()
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(key)
+    logger.info(f"[ModelServer] Generated auth key in {path}")
+    return key
+
+
+class _Pending:
+    def __init__(self, op: str, payload: Dict[str, Any]):
+        self.op = op
+        self.payload = payload
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.done = threading.Event()
+
+
+class ModelServer:
+    """Single process that owns the loaded models and serves API workers over a Unix socket.
+
+    Each client connection gets a thread that forwards requests to one batching
+    loop; requests arriving within ``max_wait_ms`` of each other share a generate call.
+    """
+
+    def __init__(self, tokenizer, model, gen_tokenizer, gen_model,
+                 address: str = MODEL_SERVER_ADDRESS, authkey: Optional[bytes] = None,
+                 max_batch: int = 8, max_wait_ms: float = 10.0):
+        self.tokenizer = tokenizer
+        self.model = model
+        self.gen_tokenizer = gen_tokenizer
+        self.gen_model = gen_model
+        self.address = address
+        self.authkey = authkey or load_authkey(create=True)
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: "queue.Queue[_Pending]" = queue.Queue()
+
+    def serve_forever(self):
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+        threading.Thread(target=self._batch_loop, daemon=True, name="model-batcher").start()
+
+        # Owner-only socket: created under a restrictive umask so there is no window before chmod
+        old_umask = os.umask(0o177)
+        try:
+            listener = Listener(self.address, family="AF_UNIX", authkey=self.authkey)
+        finally:
+            os.umask(old_umask)
+        os.chmod(self.address, 0o600)
+
+        with listener:
+            logger.info(f"[ModelServer] Listening on {self.address}")
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:
+                    logger.warning(f"[ModelServer] Rejected connection: {e}")
+                    continue
+                threading.Thread(target=self._serve_connection, args=(conn,), daemon=True).start()
+
+    def _serve_connection(self, conn: Connection):
+        with conn:
+            while True:
+                try:
+                    op, payload = conn.recv()
+                except (EOFError, OSError):
+                    return
+                pending = _Pending(op, payload)
+                self._queue.put(pending)
+                pending.done.wait()
+                conn.send(("error", pending.error) if pending.error else ("ok", pending.result))
+
+    def _collect_batch(self) -> List[_Pending]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _batch_loop(self):
+        while True:
+            batch = self._collect_batch()
+            groups: Dict[Tuple, List[_Pending]] = defaultdict(list)
+            for pending in batch:
+                if pending.op == "predict":
+                    groups[("predict", pending.payload.get("top_k", 5))].append(pending)
+                elif pending.op == "generate":
+                    groups[("generate", pending.payload.get("max_new_tokens", 256),
+                            pending.payload.get("temperature", 0.3))].append(pending)
+                else:
+                    pending.error = f"Unknown op: {pending.op}"
+                    pending.done.set()
+
+            for key, items in groups.items():
+                try:
+                    results = self._run(key, items)
+                    for pending, result in zip(items, results):
+                        pending.result = result
+                except Exception as e:
+                    logger.error(f"[ModelServer] {key[0]} batch of {len(items)} failed: {e}")
+                    for pending in items:
+                        pending.error = str(e)
+                finally:
+                    for pending in items:
+                        pending.done.set()
+
+    def _run(self, key: Tuple, items: List[_Pending]) -> List[Any]:
+        from diagnosis_pipeline.disease_predictor import generate_candidates
+
+        if key[0] == "predict":
+            return generate_candidates(
+                self.tokenizer, self.model, [p.payload["symptoms"] for p in items], top_k=key[1]
+            )
+        return generate_chat_batch(
+            self.gen_tokenizer, self.gen_model, [p.payload["messages"] for p in items],
+            max_new_tokens=key[1], temperature=key[2]
+        )
+
+
+class ModelClient:
+    """Lightweight API-worker side of the model server; one connection per thread.
+
+    Replies are awaited for at most ``timeout`` seconds, capped by the request deadline.
+    """
+
+    def __init__(self, address: str = MODEL_SERVER_ADDRESS, authkey: Optional[bytes] = None,
+                 timeout: float = MODEL_SERVER_TIMEOUT):
+        self.address = address
+        self.authkey = authkey or load_authkey()
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self) -> Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or conn.closed:
+            conn = Client(self.address, family="AF_UNIX", authkey=self.authkey)
+            self._local.conn = conn
+        return conn
+
+    def _call(self, op: str, payload: Dict[str, Any], timeout: Optional[float] = None) -> Any:
+        conn = self._connection()
+        timeout = stage_timeout(self.timeout if timeout is None else timeout)
+        try:
+            conn.send((op, payload))
+            if not conn.poll(timeout):
+                raise TimeoutError(f"Model server did not answer {op} within {timeout:.1f}s")
+            status, result = conn.recv()
+        except (EOFError, OSError):
+            # Server restarted or stalled (TimeoutError is an OSError); a late reply would
+            # desynchronize this connection, so drop it and reconnect on the next call
+            conn.close()
+            raise
+        if status == "error":
+            raise RuntimeError(f"Model server error: {result}")
+        return result
+
+    def predict(self, symptoms: List[str], top_k: int = 5) -> List[Tuple[str, float]]:
+        return [tuple(c) for c in self._call("predict", {"symptoms": symptoms, "top_k": top_k})]
+
+    def generate(self, messages: List[Dict[str, str]], max_new_tokens: int = 256,
+                 temperature: float = 0.3, timeout: Optional[float] = None) -> str:
+        return self._call("generate", {
+            "messages": messages,
+            "max_new_tokens": max_new_tokens,
+            "temperature": temperature
+        }, timeout=timeout)
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from diagnosis_pipeline.load_models import load_models
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    ModelServer(*load_models()).serve_forever()
@@ -0,0 +1,249 @@
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+_DISARMED = nullcontext()
+
+# Set only while a captured request runs, so other requests and speculative work are not timed
+_active_capture: ContextVar[Optional["ProfileCapture"]] = ContextVar("profile_capture", default=None)
+
+
+class ProfileCapture:
+    """Samples and stage timings collected while profiling the next ``requests`` chats."""
+
+    def __init__(self, requests: int, interval_ms: float = 5.0, torch_profile: bool = False):
+        self.id = time.strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6]
+        self.requested = requests
+        self.remaining = requests
+        self.interval = max(1.0, interval_ms) / 1000.0
+        self.torch_profile = torch_profile
+        self.in_flight = 0
+        self.request_ms: List[float] = []
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.stage_ms: Dict[str, List[float]] = defaultdict(list)
+        self.torch_tables: Dict[str, str] = {}
+        self.files: List[str] = []
+        self.started = time.time()
+        self.finished: Optional[float] = None
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+
+    def start_sampler(self):
+        if self._sampler is None:
+            self._sampler = threading.Thread(target=self._sample_loop, daemon=True, name="profile-sampler")
+            self._sampler.start()
+
+    def stop_sampler(self):
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+
+    def _sample_loop(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def folded(self) -> str:
+        """Brendan Gregg folded-stack format, accepted by flamegraph.pl and speedscope."""
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+    def report(self) -> Dict[str, Any]:
+        stages = {
+            name: {
+                "count": len(times),
+                "total_ms": round(sum(times), 1),
+                "mean_ms": round(sum(times) / len(times), 1),
+                "max_ms": round(max(times), 1),
+            }
+            for name, times in sorted(self.stage_ms.items())
+        }
+        return {
+            "id": self.id,
+            "status": "done" if self.finished else "capturing",
+            "requests": len(self.request_ms),
+            "requested": self.requested,
+            "request_ms": [round(ms, 1) for ms in self.request_ms],
+            "samples": self.samples,
+            "interval_ms": self.interval * 1000,
+            "stages": stages,
+            "torch": self.torch_tables,
+            "files": self.files,
+        }
+
+
+class Profiler:
+    """Process-wide on-demand profiler for live ``/chat`` traffic.
+
+    Disarmed, ``request``/``stage``/``torch_stage`` return a shared no-op context
+    after a single attribute check. Armed, the next N requests run under a
+    ``sys._current_frames`` sampling profiler (all threads, so the batcher threads
+    doing generation show up too), and stages run on behalf of those requests are
+    timed and optionally wrapped in ``torch.profiler``. Results are written to
+    ``directory`` when the capture ends.
+    """
+
+    def __init__(self, directory: str = PROFILE_DIR):
+        self.directory = directory
+        self.capture: Optional[ProfileCapture] = None
+        self.last: Optional[ProfileCapture] = None
+        self._lock = threading.Lock()
+        # torch.profiler sessions cannot nest or overlap across threads
+        self._torch_lock = threading.Lock()
+
+    def arm(self, requests: int = 10, interval_ms: float = 5.0, torch_profile: bool = False) -> ProfileCapture:
+        with self._lock:
+            if self.capture is not None:
+                raise RuntimeError(f"Capture {self.capture.id} is already in progress")
+            self.capture = self.last = ProfileCapture(max(1, requests), interval_ms, torch_profile)
+            logger.info(f"[Profiler] Armed capture {self.capture.id} for {requests} requests")
+            return self.capture
+
+    def request(self):
+        if self.capture is None:
+            return _DISARMED
+        return self._request()
+
+    @contextmanager
+    def _request(self):
+        with self._lock:
+            capture = self.capture
+            if capture is None or capture.remaining <= 0:
+                capture = None
+            else:
+                capture.remaining -= 1
+                capture.in_flight += 1
+                capture.start_sampler()
+        if capture is None:
+            yield
+            return
+
+        token = _active_capture.set(capture)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            _active_capture.reset(token)
+            with self._lock:
+                capture.request_ms.append((time.perf_counter() - start) * 1000)
+                capture.in_flight -= 1
+                done = capture.remaining == 0 and capture.in_flight == 0
+                if done:
+                    self.capture = None
+            if done:
+                self._finish(capture)
+
+    def active(self) -> Optional[ProfileCapture]:
+        """The capture the current request belongs to, if it is being profiled."""
+        if self.capture is None:
+            return None
+        return _active_capture.get()
+
+    def stage(self, name: str, capture: Optional[ProfileCapture] = None):
+        """Time a stage of the current captured request; ``capture`` attributes work done
+        on another thread (e.g. a batcher) to the request that queued it."""
+        if self.capture is None:
+            return _DISARMED
+        capture = capture or _active_capture.get()
+        if capture is None:
+            return _DISARMED
+        return self._stage(capture, name)
+
+    @contextmanager
+    def _stage(self, capture: ProfileCapture, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            capture.stage_ms[name].append((time.perf_counter() - start) * 1000)
+
+    def torch_stage(self, name: str, capture: Optional[ProfileCapture] = None):
+        """Like ``stage``, additionally under ``torch.profiler`` when the capture asked for it."""
+        if self.capture is None:
+            return _DISARMED
+        capture = capture or _active_capture.get()
+        if capture is None:
+            return _DISARMED
+        if not capture.torch_profile or not self._torch_lock.acquire(blocking=False):
+            return self._stage(capture, name)
+        return self._torch_stage(capture, name)
+
+    @contextmanager
+    def _torch_stage(self, capture: ProfileCapture, name: str):
+        # Profiler failures are logged and never reach the generate call being profiled
+        try:
+            import torch
+            from torch.profiler import ProfilerActivity, profile
+
+            activities = [ProfilerActivity.CPU]
+            if torch.cuda.is_available():
+                activities.append(ProfilerActivity.CUDA)
+            prof = profile(activities=activities)
+            prof.start()
+        except Exception as e:
+            logger.error(f"[Profiler] Could not start torch profiler for {name}: {e}")
+            prof = None
+
+        try:
+            with self._stage(capture, name):
+                yield
+        finally:
+            try:
+                if prof is not None:
+                    prof.stop()
+                    sort_by = "cuda_time_total" if torch.cuda.is_available() else "cpu_time_total"
+                    call = len(capture.stage_ms[name])
+                    capture.torch_tables[f"{name}#{call}"] = prof.key_averages().table(sort_by=sort_by, row_limit=15)
+                    os.makedirs(self.directory, exist_ok=True)
+                    trace_path = os.path.join(self.directory, f"{capture.id}-{name}-{call}.trace.json")
+                    prof.export_chrome_trace(trace_path)
+                    capture.files.append(trace_path)
+            except Exception as e:
+                logger.error(f"[Profiler] Could not export torch profile for {name}: {e}")
+            finally:
+                self._torch_lock.release()
+
+    def _finish(self, capture: ProfileCapture):
+        capture.stop_sampler()
+        capture.finished = time.time()
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            folded_path = os.path.join(self.directory, f"{capture.id}.folded")
+            with open(folded_path, "w", encoding="utf-8") as f:
+                f.write(capture.folded())
+            capture.files.append(folded_path)
+            report_path = os.path.join(self.directory, f"{capture.id}.json")
+            capture.files.append(report_path)
+            with open(report_path, "w", encoding="utf-8") as f:
+                json.dump(capture.report(), f, indent=2)
+        except OSError as e:
+            logger.error(f"[Profiler] Could not write capture {capture.id}: {e}")
+        logger.info(f"[Profiler] Capture {capture.id} done: {capture.samples} samples, "
+                    f"{len(capture.request_ms)} requests")
+
+
+PROFILER = Profiler()
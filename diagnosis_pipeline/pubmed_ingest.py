@@ -0,0 +1,265 @@
+import hashlib
+import io
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import xml.etree.ElementTree as ET
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Union
+from Bio import Entrez
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+NCBI_API_KEY = os.getenv("NCBI_API_KEY")
+INGEST_STATE_PATH = os.getenv("PUBMED_INGEST_STATE", "pubmed_ingest.sqlite3")
+ESEARCH_PAGE_SIZE = 10_000
+PUBMED_SAMPLE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "pubmed_sample.xml")
+
+
+def _word_count(text: str) -> int:
+    return len(text.split())
+
+
+def content_hash(text: str) -> str:
+    """Stable hash of whitespace/case-normalized chunk text, used for dedup."""
+    normalized = re.sub(r"\s+", " ", text.lower()).strip()
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+def iter_chunks(text: str, max_tokens: int = 300, overlap: int = 50,
+                token_counter: Optional[Callable[[str], int]] = None) -> Iterator[str]:
+    """Yield sentence-aligned chunks of at most ~max_tokens, overlapping by ~overlap tokens."""
+    count = token_counter or _word_count
+    current: List[str] = []
+    lengths: List[int] = []
+    total = 0
+
+    for sentence in re.split(r'(?<=[.!?])\s+', text):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        length = count(sentence)
+        if current and total + length > max_tokens:
+            yield " ".join(current)
+            # Carry trailing sentences forward as overlap
+            carried, carried_len = [], 0
+            for s, n in zip(reversed(current), reversed(lengths)):
+                if carried_len + n > overlap or carried_len + n + length > max_tokens:
+                    break
+                carried.insert(0, (s, n))
+                carried_len += n
+            current = [s for s, _ in carried]
+            lengths = [n for _, n in carried]
+            total = carried_len
+        current.append(sentence)
+        lengths.append(length)
+        total += length
+
+    if current:
+        yield " ".join(current)
+
+
+def iter_pubmed_articles(source: Union[str, bytes, io.IOBase]) -> Iterator[Dict[str, str]]:
+    """Stream PubmedArticle records (pmid, title, abstract) from a file path, bytes or file object."""
+    if isinstance(source, str) and source.lstrip().startswith("<"):
+        source = source.encode("utf-8")
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+
+    for _, elem in ET.iterparse(source, events=("end",)):
+        if elem.tag != "PubmedArticle":
+            continue
+        pmid = elem.findtext(".//MedlineCitation/PMID", default="").strip()
+        title_elem = elem.find(".//ArticleTitle")
+        title = "".join(title_elem.itertext()).strip() if title_elem is not None else ""
+        sections = []
+        for part in elem.findall(".//Abstract/AbstractText"):
+            label = part.get("Label")
+            body = "".join(part.itertext()).strip()
+            if body:
+                sections.append(f"{label}: {body}" if label else body)
+        elem.clear()
+        if pmid and sections:
+            yield {"pmid": pmid, "title": title, "abstract": " ".join(sections)}
+
+
+class RateLimiter:
+    """Spaces calls evenly so concurrent workers stay within NCBI's request rate."""
+
+    def __init__(self, requests_per_second: float):
+        self.interval = 1.0 / requests_per_second
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class IngestState:
+    """SQLite checkpoint of ingested PMIDs and chunk hashes so reruns skip finished work."""
+
+    def __init__(self, path: str = INGEST_STATE_PATH):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS pmids (pmid TEXT PRIMARY KEY)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS chunks (hash TEXT PRIMARY KEY)")
+        self.conn.commit()
+
+    def done_pmids(self, pmids: Iterable[str]) -> set:
+        done = set()
+        pmids = list(pmids)
+        for start in range(0, len(pmids), 500):
+            batch = pmids[start:start + 500]
+            rows = self.conn.execute(
+                f"SELECT pmid FROM pmids WHERE pmid IN ({','.join('?' * len(batch))})", batch
+            )
+            done.update(r[0] for r in rows)
+        return done
+
+    def has_chunk(self, digest: str) -> bool:
+        return self.conn.execute("SELECT 1 FROM chunks WHERE hash = ?", (digest,)).fetchone() is not None
+
+    def commit(self, pmids: Iterable[str], hashes: Iterable[str]):
+        self.conn.executemany("INSERT OR IGNORE INTO pmids VALUES (?)", [(p,) for p in pmids])
+        self.conn.executemany("INSERT OR IGNORE INTO chunks VALUES (?)", [(h,) for h in hashes])
+        self.conn.commit()
+
+
+class PubMedIngestor:
+    def __init__(self, knowledge_store, state: Optional[IngestState] = None,
+                 fetch_batch_size: int = 200, embed_batch_size: int = 256,
+                 max_workers: int = 3, requests_per_second: Optional[float] = None,
+                 chunk_tokens: int = 300, chunk_overlap: int = 50,
+                 token_counter: Optional[Callable[[str], int]] = None):
+        self.knowledge_store = knowledge_store
+        self.state = state or IngestState()
+        self.fetch_batch_size = fetch_batch_size
+        self.embed_batch_size = embed_batch_size
+        self.max_workers = max_workers
+        self.chunk_tokens = chunk_tokens
+        self.chunk_overlap = chunk_overlap
+        self.token_counter = token_counter
+        if NCBI_API_KEY:
+            Entrez.api_key = NCBI_API_KEY
+        # NCBI allows 3 req/s anonymously, 10 req/s with an API key
+        self.limiter = RateLimiter(requests_per_second or (10 if NCBI_API_KEY else 3))
+
+    def search(self, query_terms: List[str], max_results: int = 1000) -> List[str]:
+        """Page through esearch results and return up to max_results PMIDs."""
+        query = " AND ".join(query_terms)
+        pmids: List[str] = []
+        while len(pmids) < max_results:
+            self.limiter.wait()
+            handle = Entrez.esearch(db="pubmed", term=query, retstart=len(pmids),
+                                    retmax=min(ESEARCH_PAGE_SIZE, max_results - len(pmids)))
+            record = Entrez.read(handle)
+            page = record["IdList"]
+            pmids.extend(page)
+            if not page or len(pmids) >= int(record["Count"]):
+                break
+        return pmids
+
+    def _fetch(self, pmids: List[str]) -> bytes:
+        self.limiter.wait()
+        handle = Entrez.efetch(db="pubmed", id=",".join(pmids), rettype="abstract", retmode="xml")
+        return handle.read()
+
+    def fetch_articles(self, pmids: List[str]) -> Iterator[Dict[str, str]]:
+        """Fetch PMIDs in concurrent efetch batches, yielding articles in order.
+
+        At most ``max_workers`` batches are in flight or buffered at once, so memory
+        stays bounded and a slow consumer throttles fetching.
+        """
+        batches = (pmids[i:i + self.fetch_batch_size] for i in range(0, len(pmids), self.fetch_batch_size))
+        in_flight: deque = deque()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            for batch in batches:
+                in_flight.append((batch, pool.submit(self._safe_fetch, batch)))
+                if len(in_flight) >= self.max_workers:
+                    yield from self._drain(*in_flight.popleft())
+            while in_flight:
+                yield from self._drain(*in_flight.popleft())
+
+    @staticmethod
+    def _drain(batch: List[str], future) -> Iterator[Dict[str, str]]:
+        payload = future.result()
+        if payload is None:
+            logger.warning(f"[PubMedIngestor] Skipping batch of {len(batch)} PMIDs after fetch error")
+            return
+        yield from iter_pubmed_articles(payload)
+
+    def _safe_fetch(self, pmids: List[str]) -> Optional[bytes]:
+        try:
+            return self._fetch(pmids)
+        except Exception as e:
+            logger.error(f"[PubMedIngestor] efetch failed: {e}")
+            return None
+
+    def ingest_query(self, query_terms: List[str], max_results: int = 1000) -> Dict[str, int]:
+        """Search, fetch and store everything not already ingested by a previous run."""
+        pmids = self.search(query_terms, max_results)
+        done = self.state.done_pmids(pmids)
+        todo = [p for p in pmids if p not in done]
+        logger.info(f"[PubMedIngestor] {len(pmids)} PMIDs found, {len(todo)} new")
+        stats = self.ingest_articles(self.fetch_articles(todo))
+        stats["skipped_articles"] += len(done)
+        return stats
+
+    def ingest_xml(self, source: Union[str, bytes, io.IOBase] = PUBMED_SAMPLE_PATH) -> Dict[str, int]:
+        """Ingest a local PubMed XML export; defaults to the bundled offline sample."""
+        return self.ingest_articles(iter_pubmed_articles(source))
+
+    def ingest_articles(self, articles: Iterable[Dict[str, str]]) -> Dict[str, int]:
+        stats = {"articles": 0, "chunks": 0, "duplicate_chunks": 0, "skipped_articles": 0}
+        texts: List[str] = []
+        metadatas: List[Dict[str, str]] = []
+        ids: List[str] = []
+        hashes: List[str] = []
+        pending_pmids: List[str] = []
+        batch_hashes = set()
+
+        def flush():
+            if texts:
+                self.knowledge_store.add_texts(texts=texts, metadatas=metadatas, ids=ids)
+            # Checkpoint only after the upsert succeeded
+            self.state.commit(pending_pmids, hashes)
+            for buf in (texts, metadatas, ids, hashes, pending_pmids):
+                buf.clear()
+            batch_hashes.clear()
+
+        for article in articles:
+            pmid = article["pmid"]
+            if self.state.done_pmids([pmid]):
+                stats["skipped_articles"] += 1
+                continue
+            text = f"{article['title']} {article['abstract']}".strip()
+            for j, chunk in enumerate(iter_chunks(text, self.chunk_tokens, self.chunk_overlap,
+                                                  self.token_counter)):
+                digest = content_hash(chunk)
+                if digest in batch_hashes or self.state.has_chunk(digest):
+                    stats["duplicate_chunks"] += 1
+                    continue
+                batch_hashes.add(digest)
+                texts.append(chunk)
+                metadatas.append({"source": f"pubmed_{pmid}", "pmid": pmid})
+                ids.append(f"pubmed_{pmid}_chunk_{j}")
+                hashes.append(digest)
+                stats["chunks"] += 1
+            pending_pmids.append(pmid)
+            stats["articles"] += 1
+            if len(texts) >= self.embed_batch_size:
+                flush()
+
+        flush()
+        return stats
@@ -1,20 +1,35 @@
 import logging
 import json
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from openai import OpenAI
+from diagnosis_pipeline.deadline import stage_allowed, stage_timeout, record_degradation
+from diagnosis_pipeline.utils import generate_fallback_reasoning
+from diagnosis_pipeline.local_llm import ModelRouter
+from diagnosis_pipeline.conversation_memory import memory_window
 
 logger = logging.getLogger(__name__)
 
 class ReasoningGenerator:
-    def __init__(self, openai_api_key: str, memory, knowledge_store):
-        self.client = OpenAI(api_key=openai_api_key)
+    def __init__(self, openai_api_key: str, memory, knowledge_store, router: Optional[ModelRouter] = None,
+                 client=None):
+        self.client = client or OpenAI(api_key=openai_api_key)
+        self.router = router
         self.memory = memory
         self.knowledge_store = knowledge_store
 
     def generate(self, symptoms: List[str], diagnosis: Dict, patient_profile: Dict[str, Any],
-                 last_user_input: str, max_history: int = 6) -> Dict[str, str]:
+                 last_user_input: str, max_history: int = 6,
+                 max_history_tokens: int = 800) -> Dict[str, str]:
 
-        history = self.memory.load_memory_variables({"input": last_user_input})["chat_history"][-max_history:]
+        if not stage_allowed("reasoning"):
+            record_degradation("reasoning", "template_reasoning")
+            return {
+                "steps": "Step-by-step reasoning not available.",
+                "summary": generate_fallback_reasoning(symptoms, diagnosis)
+            }
+
+        history = memory_window(self.memory, max_messages=max_history, max_tokens=max_history_tokens,
+                                include_summary=True)
         history_block = "\n".join(f"- {m}" for m in history) if history else ""
 
         demo_section = ""
@@ -26,18 +41,20 @@ class ReasoningGenerator:
                 f"{patient_profile.get('height','?')}cm\n\n"
             )
 
+        # Keep the evidence query to diagnosis + symptoms so repeat lookups hit the index cache
         query = (
-            f"Patient Profile: {demo_section}"
-            f"Patient presenting with: {', '.join(symptoms)}\n"
-            f"Possible diagnosis: {diagnosis['disease']}\n"
-            "Required: pathophysiology, diagnostic criteria, differential diagnosis"
+            f"{diagnosis['disease']}: {', '.join(sorted(symptoms))}. "
+            "Pathophysiology, diagnostic criteria, differential diagnosis"
         )
 
-        try:
-            chunks = self.knowledge_store.similarity_search(query, k=5)
-        except Exception as e:
-            logger.warning(f"[ReasoningGenerator] Knowledge search failed: {e}")
-            chunks = []
+        chunks = []
+        if not stage_allowed("evidence"):
+            record_degradation("evidence", "no_evidence")
+        else:
+            try:
+                chunks = self.knowledge_store.similarity_search(query, k=5)
+            except Exception as e:
+                logger.warning(f"[ReasoningGenerator] Knowledge search failed: {e}")
 
         knowledge_text = "\n".join("- " + c.page_content for c in chunks) if chunks else "No specific evidence found"
 
@@ -70,22 +87,34 @@ Final Analysis:"""
                     {"role": "system", "content": system_msg},
                     {"role": "user", "content": prompt}
                 ],
-                temperature=0.3
+                temperature=0.3,
+                timeout=stage_timeout(30)
             )
             reasoning = resp.choices[0].message.content.strip()
 
+            if not stage_allowed("reasoning_summary"):
+                record_degradation("reasoning_summary", "template_summary")
+                return {"steps": reasoning, "summary": generate_fallback_reasoning(symptoms, diagnosis)}
+
             # Condensed summary
             summary_prompt = (
                 f"Here is a detailed clinical reasoning:\n{reasoning}\n\n"
                 "Please condense that into one paragraph, ending with the disclaimer:"
                 " 'This is not medical advice—please consult a qualified healthcare professional.'"
             )
-            sum_resp = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": summary_prompt}],
-                temperature=0.3
-            )
-            summary = sum_resp.choices[0].message.content.strip()
+            summary_messages = [{"role": "user", "content": summary_prompt}]
+            if self.router:
+                summary = self.router.complete("reasoning_summary", summary_messages, model="gpt-3.5-turbo",
+                                               temperature=0.3, max_new_tokens=256,
+                                               timeout=stage_timeout(15))
+            else:
+                sum_resp = self.client.chat.completions.create(
+                    model="gpt-3.5-turbo",
+                    messages=summary_messages,
+                    temperature=0.3,
+                    timeout=stage_timeout(15)
+                )
+                summary = sum_resp.choices[0].message.content.strip()
 
             return {
                 "steps": reasoning,
@@ -94,7 +123,8 @@ Final Analysis:"""
 
         except Exception as e:
             logger.error(f"[ReasoningGenerator] Error generating reasoning: {e}")
+            record_degradation("reasoning", "template_reasoning")
             return {
                 "steps": "Step-by-step reasoning not available.",
-                "summary": ""
+                "summary": generate_fallback_reasoning(symptoms, diagnosis)
             }
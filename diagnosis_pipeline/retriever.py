@@ -1,7 +1,10 @@
 import logging
 import json
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 from typing import List, Dict, Optional
 from Bio import Entrez
+from diagnosis_pipeline.pubmed_ingest import PubMedIngestor, IngestState, content_hash
+from diagnosis_pipeline.deadline import stage_allowed, stage_timeout, record_degradation
 from openai import OpenAI
 from dotenv import load_dotenv
 import os
@@ -11,30 +14,53 @@ load_dotenv()
 logger = logging.getLogger(__name__)
 Entrez.email = os.getenv("EMAIL_ID") # Replace or override with env var
 
+
+def open_pinecone_index(api_key: Optional[str] = None, index_name: Optional[str] = None):
+    """The Pinecone index named by PINECONE_INDEX, or None when Pinecone is not configured."""
+    api_key = api_key or os.getenv("PINECONE_API_KEY")
+    index_name = index_name or os.getenv("PINECONE_INDEX")
+    if not api_key or not index_name:
+        logger.warning("[MedicalRetriever] PINECONE_API_KEY/PINECONE_INDEX not set; RAG lookup disabled")
+        return None
+    from pinecone import Pinecone
+    return Pinecone(api_key=api_key).Index(index_name)
+
 class MedicalRetriever:
-    def __init__(self, openai_api_key: str, pinecone_index=None, icd_mapper=None, knowledge_store=None):
-        self.openai_client = OpenAI(api_key=openai_api_key)
+    def __init__(self, openai_api_key: str, pinecone_index=None, icd_mapper=None, knowledge_store=None,
+                 client=None):
+        self.openai_client = client or OpenAI(api_key=openai_api_key)
         self.pinecone_index = pinecone_index
         self.icd_mapper = icd_mapper
         self.knowledge_store = knowledge_store
+        # The Pinecone client has no per-call timeout; queries run here so callers can stop waiting
+        self._query_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="pinecone-query")
 
     def rag_lookup(self, symptoms: List[str], top_k: int = 5) -> List[Dict]:
         """Query Pinecone for similar diseases and map ICD-10 codes."""
         if not self.pinecone_index:
             return []
 
+        if not stage_allowed("rag"):
+            record_degradation("rag", "llm_only_predictions")
+            return []
+
         query = "Symptoms: " + ", ".join(symptoms)
         try:
             emb_resp = self.openai_client.embeddings.create(
-                model="text-embedding-ada-002", input=query
+                model="text-embedding-ada-002", input=query, timeout=stage_timeout(10)
             )
             vec = emb_resp.data[0].embedding
 
-            resp = self.pinecone_index.query(
-                vector=vec,
-                top_k=top_k,
-                include_metadata=True
+            future = self._query_pool.submit(
+                self.pinecone_index.query, vector=vec, top_k=top_k, include_metadata=True
             )
+            try:
+                resp = future.result(timeout=stage_timeout(5))
+            except FutureTimeout:
+                future.cancel()
+                record_degradation("rag", "llm_only_predictions")
+                logger.warning("[Retriever] Pinecone query timed out")
+                return []
 
             results = []
             for match in resp["matches"]:
@@ -79,15 +105,25 @@ class MedicalRetriever:
         metadatas = []
         ids = []
 
-        for i, article in enumerate(articles):
+        for article in articles:
+            # Content-derived IDs stay stable across calls instead of colliding on position
+            doc_id = content_hash(article)[:16]
             article_chunks = self._chunk_text(article)
             for j, chunk in enumerate(article_chunks):
                 chunks.append(chunk)
-                metadatas.append({"source": f"pubmed_{i}"})
-                ids.append(f"doc_{i}_chunk_{j}")
+                metadatas.append({"source": f"pubmed_{doc_id}"})
+                ids.append(f"doc_{doc_id}_chunk_{j}")
 
         self.knowledge_store.add_texts(texts=chunks, metadatas=metadatas, ids=ids)
 
+    def ingest_pubmed(self, query_terms: List[str], max_results: int = 1000,
+                      state_path: Optional[str] = None) -> Dict[str, int]:
+        """Resumable, deduplicating bulk ingestion of PubMed abstracts into the knowledge base."""
+        if not self.knowledge_store:
+            return {}
+        state = IngestState(state_path) if state_path else None
+        return PubMedIngestor(self.knowledge_store, state=state).ingest_query(query_terms, max_results)
+
     def _chunk_text(self, text: str, chunk_size: int = 300) -> List[str]:
         """Break a long text into chunks for embedding."""
         import re
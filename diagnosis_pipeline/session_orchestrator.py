@@ -1,11 +1,28 @@
 # diagnosis_pipeline/session_orchestrator.py
 
-from typing import Optional, Dict, Any, List, Set
+from typing import Optional, Dict, Any, List, Set, Tuple
+import contextvars
 import logging
 import re
+from array import array
 from collections import defaultdict
+from contextlib import nullcontext
 
 from diagnosis_pipeline.medical_assistant import MedicalAssistant
+from diagnosis_pipeline.speculative import SpeculativeExecutor
+from diagnosis_pipeline.conversation_memory import ConversationMemory, record_exchange
+from diagnosis_pipeline.session_store import SessionStore
+from diagnosis_pipeline.intent_classifier import IntentClassifier
+from diagnosis_pipeline.answer_parser import parse_yes_no
+from diagnosis_pipeline.deadline import Deadline, current_deadline, stage_allowed, record_degradation
+from diagnosis_pipeline.symptom_vocab import VOCAB
+from diagnosis_pipeline.profiling import PROFILER
+from diagnosis_pipeline.admission import (
+    AdmissionController,
+    PRIORITY_FOLLOWUP,
+    PRIORITY_NEW,
+    PRIORITY_SPECULATIVE
+)
 CONFIDENCE_HIGH = 0.8  # Adjust as needed
 
 class ConversationProfile:
@@ -55,19 +72,72 @@ class ConversationProfile:
 
         return demographics
 
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "data": self.data,
+            "original_query": self.original_query,
+            "demographics_asked": self.demographics_asked,
+        }
+
+    @classmethod
+    def from_dict(cls, state: Dict[str, Any]) -> "ConversationProfile":
+        profile = cls()
+        profile.data = dict(state.get("data", {}))
+        profile.original_query = state.get("original_query")
+        profile.demographics_asked = state.get("demographics_asked", False)
+        return profile
+
 
 class SessionOrchestrator:
-    def __init__(self, assistant: MedicalAssistant):
+    """One conversation turn at a time, resumable on any worker through ``store``.
+
+    Per-session memory routing and persistence need the assistant's memory to be a
+    ConversationMemory (``session``/``export_session``/``import_session``). Any other
+    memory object only has to provide ``save_context`` and ``load_memory_variables``;
+    it is then shared by all sessions and not saved with the session state.
+    """
+
+    def __init__(self, assistant: MedicalAssistant, speculator: Optional[SpeculativeExecutor] = None,
+                 store: Optional[SessionStore] = None, session_id: str = "default",
+                 intent_classifier: Optional[IntentClassifier] = None,
+                 admission: Optional[AdmissionController] = None):
         self.assistant = assistant
+        self.admission = admission
+        self._priority = PRIORITY_NEW
+        self.intent_classifier = intent_classifier
+        self.speculator = speculator
+        self.store = store
+        self.session_id = session_id
         self.profile = ConversationProfile()
         self.logger = logging.getLogger(__name__)
         self._in_diagnosis = False
         self._awaiting_demographics = False
-        self.pending_symptoms: List[str] = []
+        self._pending_ids = array("I")
         self.last_question: Optional[str] = None
         self.followup_count: int = 0
         self.asked_dims: Set[str] = set()
         self.current_predictions: List[Dict] = []
+        self.question_targets: List[str] = []
+        self.ruled_out: List[str] = []
+        # Speculation keys are (session_id, symptom set) so sessions never touch each other's branches
+        self._speculated: List[Tuple[str, frozenset]] = []
+        # Symptom set current_predictions were computed for
+        self._predicted_for: Optional[frozenset] = None
+
+    @property
+    def _session_memory(self) -> Optional[ConversationMemory]:
+        memory = self.assistant.memory
+        return memory if isinstance(memory, ConversationMemory) else None
+
+    @property
+    def pending_symptoms(self) -> List[str]:
+        return VOCAB.decode(self._pending_ids)
+
+    @pending_symptoms.setter
+    def pending_symptoms(self, symptoms: List[str]):
+        # Vocabulary IDs, or transient ones for unknown names (the orchestrator lives for one request);
+        # normalization and synonym folding make the array a set
+        self._pending_ids = VOCAB.encode(symptoms)
 
     def _reset_diagnosis_state(self):
         self._in_diagnosis = False
@@ -77,14 +147,160 @@ class SessionOrchestrator:
         self.followup_count = 0
         self.asked_dims.clear()
         self.current_predictions = []
+        self.question_targets = []
+        self.ruled_out = []
+        self._predicted_for = None
+        self._cancel_speculation()
+
+    def to_state(self) -> Dict[str, Any]:
+        """Everything needed to resume this conversation on another worker."""
+        return {
+            "in_diagnosis": self._in_diagnosis,
+            "awaiting_demographics": self._awaiting_demographics,
+            # Names, not IDs: vocabulary IDs are assigned per process
+            "pending_symptoms": self.pending_symptoms,
+            "last_question": self.last_question,
+            "followup_count": self.followup_count,
+            "asked_dims": sorted(self.asked_dims),
+            "current_predictions": self.current_predictions,
+            "question_targets": self.question_targets,
+            "ruled_out": self.ruled_out,
+            "speculated": [sorted(symptoms) for _, symptoms in self._speculated],
+            "predicted_for": sorted(self._predicted_for) if self._predicted_for is not None else None,
+            "profile": self.profile.to_dict(),
+            "memory": self._session_memory.export_session(self.session_id) if self._session_memory else {},
+        }
+
+    def load_state(self, state: Dict[str, Any]):
+        self._in_diagnosis = state.get("in_diagnosis", False)
+        self._awaiting_demographics = state.get("awaiting_demographics", False)
+        self.pending_symptoms = state.get("pending_symptoms", [])
+        self.last_question = state.get("last_question")
+        self.followup_count = state.get("followup_count", 0)
+        self.asked_dims = set(state.get("asked_dims", []))
+        self.current_predictions = list(state.get("current_predictions", []))
+        self.question_targets = list(state.get("question_targets", []))
+        self.ruled_out = list(state.get("ruled_out", []))
+        self._speculated = [(self.session_id, frozenset(key)) for key in state.get("speculated", [])]
+        predicted_for = state.get("predicted_for")
+        self._predicted_for = frozenset(predicted_for) if predicted_for is not None else None
+        self.profile = ConversationProfile.from_dict(state.get("profile", {}))
+        if self._session_memory:
+            self._session_memory.import_session(state.get("memory", {}), self.session_id)
+
+    @staticmethod
+    def _symptom_set(symptoms: List[str]) -> frozenset:
+        return frozenset(VOCAB.canonical(s) for s in symptoms)
+
+    def _symptom_key(self, symptoms: List[str]) -> Tuple[str, frozenset]:
+        return self.session_id, self._symptom_set(symptoms)
+
+    def _predict(self, symptoms: List[str], priority: int = PRIORITY_NEW,
+                 timeout: Optional[float] = None) -> List[Dict]:
+        with PROFILER.stage("rag"):
+            rag_predictions = self.assistant.rag_lookup(symptoms, top_k=5)
+        # The model stage is GPU-bound; queue for it (or get shed) instead of piling up
+        slot = self.admission.admit(priority, timeout) if self.admission else nullcontext()
+        with slot, PROFILER.stage("predict"):
+            llm_predictions = self.assistant.predict_diseases(symptoms, top_k=5)
+        with PROFILER.stage("evaluate"):
+            return self.assistant.evaluate_predictions(rag_predictions, llm_predictions, symptoms)
+
+    def _predictions_for(self, symptoms: List[str]) -> List[Dict]:
+        """Reuse this round's predictions if the symptom set is unchanged (a "no"),
+        else a speculatively precomputed branch, else predict now."""
+        key = self._symptom_key(symptoms)
+        predicted_for, self._predicted_for = self._predicted_for, key[1]
+        if self.current_predictions and predicted_for == key[1]:
+            self._cancel_speculation()
+            return self.current_predictions
+        if self.speculator and self._speculated:
+            precomputed = self.speculator.take(key) if key in self._speculated else None
+            self._cancel_speculation()
+            if precomputed is not None:
+                self.logger.debug("Serving precomputed predictions for %s", sorted(key[1]))
+                return precomputed
+        return self._predict(symptoms, self._priority)
+
+    def _speculate(self):
+        """While the user answers a missing-symptom question, precompute the "yes" branches.
+
+        A "no" leaves the symptom set unchanged and is served from current_predictions,
+        so only confirmations are speculated: all targets first (the likeliest answer),
+        then each target alone for partial answers.
+        """
+        if not self.speculator or not self.question_targets:
+            return
+        base = self.pending_symptoms
+        branches = [self.question_targets]
+        if len(self.question_targets) > 1:
+            branches += [[target] for target in self.question_targets]
+        for added in branches:
+            symptoms = VOCAB.dedupe(base + added)
+            key = self._symptom_key(symptoms)
+            if key in self._speculated:
+                continue
+            self._speculated.append(key)
+            self.speculator.submit(key, self._speculative_task(symptoms))
+
+    def _speculative_task(self, symptoms: List[str]):
+        """Bind a speculative prediction to this request's context (memory session,
+        profiler capture) so it runs in the pool thread as it would inline."""
+        context = contextvars.copy_context()
+        deadline = current_deadline()
+
+        def predict():
+            # The branch stands in for the next turn's prediction, which gets a full budget;
+            # by the time the pool is idle this turn's own deadline is mostly spent
+            with Deadline(deadline.seconds).activate() if deadline else nullcontext():
+                # Speculation only uses an idle model slot; it never queues behind live turns
+                return self._predict(symptoms, PRIORITY_SPECULATIVE, timeout=0)
+
+        return lambda: context.run(predict)
+
+    def _cancel_speculation(self):
+        if self.speculator and self._speculated:
+            pending = set(self._speculated)
+            self.speculator.cancel(lambda key: key in pending)
+        self._speculated = []
+
+    def _parse_answer(self, text: str) -> List[str]:
+        """Resolve plain yes/no replies to a symptom question locally where they are
+        unambiguous; send anything else to the LLM analyzer.
+
+        A "no" rules out every symptom asked about. A "yes" only confirms a question
+        about a single symptom: "do you have a cough or chills?" - "yes" may mean either.
+        """
+        if self.question_targets:
+            answer = parse_yes_no(text)
+            targets = VOCAB.dedupe(self.question_targets)
+            if answer is False:
+                self.ruled_out = VOCAB.dedupe(self.ruled_out + targets)
+                return []
+            if answer and len(targets) == 1:
+                return targets
+
+        with PROFILER.stage("analyze_response"):
+            parsed = self.assistant.analyze_response(self.last_question, text)
+        return parsed.get('new_symptoms', [])
+
+    def _classify_intent(self, text: str) -> str:
+        """Route locally when the on-box classifier is confident; otherwise ask the LLM."""
+        if self.intent_classifier:
+            label, confidence = self.intent_classifier.predict(text)
+            if confidence >= self.intent_classifier.threshold:
+                return label
+        with PROFILER.stage("intent"):
+            return self.assistant.classify_intent(text)
 
     def _get_final_diagnosis_response(self, top_prediction: Dict) -> str:
-        reasoning = self.assistant.generate_reasoning(
-            self.pending_symptoms,
-            top_prediction,
-            self.profile.data,
-            last_user_input=self.last_question or ""
-        )
+        with PROFILER.stage("reasoning"):
+            reasoning = self.assistant.generate_reasoning(
+                self.pending_symptoms,
+                top_prediction,
+                self.profile.data,
+                last_user_input=self.last_question or ""
+            )
 
         treatment = (
             self.assistant.meta_df.loc[
@@ -95,10 +311,15 @@ class SessionOrchestrator:
             else 'No established treatment found'
         )
 
-        precautions = self.assistant.generate_precautions(
-            top_prediction['disease'],
-            treatment
-        )
+        if stage_allowed("precautions"):
+            with PROFILER.stage("precautions"):
+                precautions = self.assistant.generate_precautions(
+                    top_prediction['disease'],
+                    treatment
+                )
+        else:
+            record_degradation("precautions", "template_precautions")
+            precautions = f"Please consult your doctor about precautions for {top_prediction['disease']}."
 
         return (
             f"📋 **Diagnosis:** {top_prediction['disease']} (ICD-10: {top_prediction['icd10']}, Confidence: {top_prediction['confidence']:.0%})\n\n"
@@ -108,14 +329,7 @@ class SessionOrchestrator:
         )
 
     def _evaluate_predictions_and_respond(self) -> str:
-        rag_predictions = self.assistant.rag_lookup(self.pending_symptoms, top_k=5)
-        llm_predictions = self.assistant.predict_diseases(self.pending_symptoms, top_k=5)
-
-        self.current_predictions = self.assistant.evaluate_predictions(
-            rag_predictions,
-            llm_predictions,
-            self.pending_symptoms
-        )
+        self.current_predictions = self._predictions_for(self.pending_symptoms)
 
         if not self.current_predictions:
             self._reset_diagnosis_state()
@@ -124,24 +338,52 @@ class SessionOrchestrator:
         top_prediction = self.current_predictions[0]
 
         if (top_prediction['confidence'] < CONFIDENCE_HIGH and self.followup_count < 3):
-            followups = self.assistant.generate_followups(
-                symptoms=self.pending_symptoms,
-                predictions=self.current_predictions,
-                asked_dims=self.asked_dims,
-                patient_profile=self.profile.data,
-                last_user_input=self.last_question or ""
-            )
+            self.question_targets = []
+            with PROFILER.stage("followup"):
+                followups = self.assistant.generate_followups(
+                    symptoms=self.pending_symptoms,
+                    predictions=self.current_predictions,
+                    asked_dims=self.asked_dims,
+                    patient_profile=self.profile.data,
+                    last_user_input=self.last_question or "",
+                    targets=self.question_targets,
+                    ruled_out=self.ruled_out
+                )
 
             if followups:
                 self.followup_count += 1
                 self.last_question = followups[0]
+                self._speculate()
                 return f"🤔 {self.last_question}"
 
         response = self._get_final_diagnosis_response(top_prediction)
         self._reset_diagnosis_state()
         return response
 
-    def handle(self, user_input: str) -> str:
+    def handle(self, user_input: str, deadline: Optional[Deadline] = None) -> str:
+        # Every agent call in this turn shares one time budget; stages degrade when it runs low
+        deadline = deadline or Deadline()
+        # Live turns take priority: speculative work waits until this returns
+        # Symptom IDs held by this orchestrator stay decodable for the whole request
+        with deadline.activate(), VOCAB.pinned(), self.speculator.live() if self.speculator else nullcontext():
+            if self.store:
+                with PROFILER.stage("session_load"):
+                    self.load_state(self.store.load(self.session_id) or {})
+            # Conversations already under way are served before new ones
+            ongoing = self._in_diagnosis or self._awaiting_demographics
+            self._priority = PRIORITY_FOLLOWUP if ongoing else PRIORITY_NEW
+            if self.admission:
+                # Shed before intent, extraction and RAG spend time on a turn that would not get a slot
+                self.admission.check(self._priority)
+            memory = self._session_memory
+            with memory.session(self.session_id) if memory else nullcontext():
+                reply = self._handle(user_input)
+            if self.store:
+                with PROFILER.stage("session_save"):
+                    self.store.save(self.session_id, self.to_state())
+            return reply
+
+    def _handle(self, user_input: str) -> str:
         text = user_input.strip()
 
         if text.lower() in ['/clear', '/reset']:
@@ -160,27 +402,23 @@ class SessionOrchestrator:
 
             self._awaiting_demographics = False
             self._in_diagnosis = True
-            self.pending_symptoms = self.assistant.extract_symptoms(self.profile.original_query)
+            with PROFILER.stage("extract"):
+                self.pending_symptoms = self.assistant.extract_symptoms(self.profile.original_query)
             return self._evaluate_predictions_and_respond()
 
         if self._in_diagnosis and self.last_question:
-            parsed = self.assistant.analyze_response(self.last_question, text)
-            new_symptoms = parsed.get('new_symptoms', [])
+            new_symptoms = self._parse_answer(text)
 
             if new_symptoms:
-                self.pending_symptoms.extend(new_symptoms)
-                self.pending_symptoms = list(set(self.pending_symptoms))
+                self._pending_ids.extend(i for i in VOCAB.encode(new_symptoms) if i not in self._pending_ids)
 
-            self.assistant.memory.save_context(
-                {"input": self.last_question},
-                {"output": text}
-            )
+            record_exchange(self.assistant.memory, self.last_question, text)
 
             self.last_question = None
             return self._evaluate_predictions_and_respond()
 
         if not self._in_diagnosis:
-            intent = self.assistant.classify_intent(text)
+            intent = self._classify_intent(text)
 
             if intent == 'symptom_diagnosis':
                 self.profile.original_query = text
@@ -190,7 +428,8 @@ class SessionOrchestrator:
                     return self.profile.get_demographics_prompt()
 
                 self._in_diagnosis = True
-                self.pending_symptoms = self.assistant.extract_symptoms(text)
+                with PROFILER.stage("extract"):
+                    self.pending_symptoms = self.assistant.extract_symptoms(text)
                 return self._evaluate_predictions_and_respond()
 
             elif intent == 'patient_history':
@@ -0,0 +1,127 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+SESSION_STORE_URL = os.getenv("SESSION_STORE_URL", "sqlite:///sessions.sqlite3")
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", str(24 * 3600)))
+
+
+def encode_state(state: Dict[str, Any]) -> bytes:
+    """Compact wire format: minified JSON, zlib-compressed."""
+    return zlib.compress(json.dumps(state, separators=(",", ":"), ensure_ascii=False).encode("utf-8"))
+
+
+def decode_state(blob: bytes) -> Dict[str, Any]:
+    return json.loads(zlib.decompress(blob).decode("utf-8"))
+
+
+class SessionStore:
+    """Backend holding per-conversation state so any worker can serve any turn."""
+
+    def load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def save(self, session_id: str, state: Dict[str, Any]):
+        raise NotImplementedError
+
+    def delete(self, session_id: str):
+        raise NotImplementedError
+
+
+class SQLiteSessionStore(SessionStore):
+    """SQLite-backed store; expired rows are purged from ``save`` at most every ``purge_interval`` seconds."""
+
+    def __init__(self, path: str = "sessions.sqlite3", ttl_seconds: int = SESSION_TTL_SECONDS,
+                 purge_interval: float = 300.0):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.purge_interval = purge_interval
+        self._next_purge = time.monotonic() + purge_interval
+        self._purge_lock = threading.Lock()
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        # One connection per thread (and per process after fork); WAL allows concurrent readers
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, state BLOB, updated_at REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at)")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute(
+            "SELECT state, updated_at FROM sessions WHERE id = ?", (session_id,)
+        ).fetchone()
+        if row is None or time.time() - row[1] > self.ttl_seconds:
+            return None
+        return decode_state(row[0])
+
+    def save(self, session_id: str, state: Dict[str, Any]):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO sessions (id, state, updated_at) VALUES (?, ?, ?)",
+            (session_id, encode_state(state), time.time())
+        )
+        if time.monotonic() >= self._next_purge and self._purge_lock.acquire(blocking=False):
+            try:
+                self._next_purge = time.monotonic() + self.purge_interval
+                self.purge_expired()
+            finally:
+                self._purge_lock.release()
+
+    def purge_expired(self) -> int:
+        """Delete sessions idle for longer than the TTL; returns the number removed."""
+        try:
+            cursor = self._conn().execute(
+                "DELETE FROM sessions WHERE updated_at < ?", (time.time() - self.ttl_seconds,)
+            )
+        except sqlite3.OperationalError as e:
+            # Another worker holds the write lock; the next purge will catch up
+            logger.warning(f"[SQLiteSessionStore] Purge skipped: {e}")
+            return 0
+        if cursor.rowcount:
+            logger.info(f"[SQLiteSessionStore] Purged {cursor.rowcount} expired sessions")
+        return cursor.rowcount
+
+    def delete(self, session_id: str):
+        self._conn().execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+
+class RedisSessionStore(SessionStore):
+    def __init__(self, url: str, ttl_seconds: int = SESSION_TTL_SECONDS, prefix: str = "session:"):
+        import redis  # optional dependency, only needed for this backend
+        self.client = redis.Redis.from_url(url)
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+
+    def load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        blob = self.client.get(self.prefix + session_id)
+        return decode_state(blob) if blob else None
+
+    def save(self, session_id: str, state: Dict[str, Any]):
+        self.client.set(self.prefix + session_id, encode_state(state), ex=self.ttl_seconds)
+
+    def delete(self, session_id: str):
+        self.client.delete(self.prefix + session_id)
+
+
+def create_session_store(url: str = SESSION_STORE_URL) -> SessionStore:
+    """Build a store from a URL: ``sqlite:///path.db`` or ``redis://host:port/db``."""
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisSessionStore(url)
+    if url.startswith("sqlite:///"):
+        return SQLiteSessionStore(url[len("sqlite:///"):])
+    raise ValueError(f"Unsupported session store URL: {url}")
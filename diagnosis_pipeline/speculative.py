@@ -0,0 +1,101 @@
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Hashable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class SpeculativeExecutor:
+    """Runs speculative work (e.g. the next round's predictions) on idle capacity.
+
+    Tasks only start while no live request is in flight, so speculation never
+    competes with a user who is waiting. Results are looked up by key and
+    discarded if the conversation moves on.
+    """
+
+    def __init__(self, max_workers: int = 1, max_results: int = 256):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="speculative")
+        self._results: "OrderedDict[Hashable, Tuple[Future, threading.Event]]" = OrderedDict()
+        self.max_results = max_results
+        self._live = 0
+        self._idle = threading.Event()
+        self._idle.set()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @contextmanager
+    def live(self):
+        """Mark a live request as in flight; speculative tasks wait until it finishes."""
+        with self._lock:
+            self._live += 1
+            self._idle.clear()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._live -= 1
+                if self._live == 0:
+                    self._idle.set()
+
+    def submit(self, key: Hashable, fn: Callable[[], Any]):
+        """Schedule fn under key unless a result for key is already pending or done."""
+        with self._lock:
+            if key in self._results:
+                return
+            started = threading.Event()
+            future = self._pool.submit(self._run, key, fn, started)
+            self._results[key] = (future, started)
+            while len(self._results) > self.max_results:
+                _, (stale, _) = self._results.popitem(last=False)
+                stale.cancel()
+
+    def _run(self, key: Hashable, fn: Callable[[], Any], started: threading.Event) -> Any:
+        # Yield to live traffic before starting; once started the task is not interruptible
+        self._idle.wait()
+        with self._lock:
+            if key not in self._results:
+                return None
+            started.set()
+        try:
+            return fn()
+        except Exception as e:
+            logger.warning(f"[SpeculativeExecutor] Task {key!r} failed: {e}")
+            return None
+
+    def take(self, key: Hashable, join_timeout: float = 30.0) -> Optional[Any]:
+        """Pop the result for key. A task that already started is joined (finishing it is
+        cheaper than starting over); one that has not started is cancelled."""
+        with self._lock:
+            entry = self._results.pop(key, None)
+            running = entry is not None and entry[1].is_set()
+        if entry is None:
+            self.misses += 1
+            return None
+        future = entry[0]
+        result = None
+        if future.done() or running:
+            try:
+                result = future.result(timeout=join_timeout)
+            except Exception:
+                result = None
+        else:
+            future.cancel()
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return result
+
+    def cancel(self, predicate: Callable[[Hashable], bool] = lambda key: True):
+        """Drop pending and finished results whose key matches predicate."""
+        with self._lock:
+            for key in [k for k in self._results if predicate(k)]:
+                self._results.pop(key)[0].cancel()
+
+    def shutdown(self):
+        self.cancel()
+        self._pool.shutdown(wait=False)
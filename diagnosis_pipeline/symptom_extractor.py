@@ -1,13 +1,41 @@
 import logging
 import json
+import re
 from openai import OpenAI
-from typing import List
+from typing import Dict, List, Optional
+from diagnosis_pipeline.llm_cache import LLMResponseCache
+from diagnosis_pipeline.deadline import stage_allowed, stage_timeout, record_degradation
+from diagnosis_pipeline.local_llm import ModelRouter
+from diagnosis_pipeline.symptom_vocab import VOCAB
 
 logger = logging.getLogger(__name__)
 
+
+def parse_symptom_list(content: str) -> Optional[List[str]]:
+    """Canonical symptom names from a JSON-array reply, or None if the reply is not one."""
+    # Small local models sometimes wrap the array in prose; keep just the array
+    if match := re.search(r"\[.*\]", content, re.DOTALL):
+        content = match.group(0)
+    try:
+        symptoms = json.loads(content)
+    except ValueError:
+        return None
+    if not isinstance(symptoms, list):
+        return None
+    # Canonical names, so "Headache" and "headache " are one symptom downstream
+    return VOCAB.dedupe(str(s) for s in symptoms)
+
+
+def _is_symptom_list(content: str) -> bool:
+    return parse_symptom_list(content) is not None
+
+
 class SymptomExtractor:
-    def __init__(self, openai_api_key: str):
-        self.client = OpenAI(api_key=openai_api_key)
+    def __init__(self, openai_api_key: str, cache: Optional[LLMResponseCache] = None,
+                 router: Optional[ModelRouter] = None, client=None):
+        self.client = client or OpenAI(api_key=openai_api_key)
+        self.cache = cache
+        self.router = router
 
     def extract(self, user_text: str) -> List[str]:
         messages = [
@@ -18,19 +46,46 @@ class SymptomExtractor:
             )},
             {"role": "user", "content": user_text}
         ]
+        return self._extract("symptom_extraction", messages, user_text)
+
+    def extract_from_answer(self, question: str, answer: str) -> List[str]:
+        """Symptoms the patient confirms in their answer to a follow-up question."""
+        messages = [
+            {"role": "system", "content": (
+                "You are a medical assistant. A patient answered a follow-up question. "
+                "List the symptoms the answer confirms the patient has, including symptoms named in the "
+                "question that they say yes to. Leave out anything they deny or are unsure about. "
+                "⚠️ Respond _only_ with a JSON array of symptom strings—no explanations or extra text."
+            )},
+            {"role": "user", "content": f"Question: {question}\nAnswer: {answer}"}
+        ]
+        return self._extract("answer_analysis", messages, answer)
+
+    def _extract(self, task: str, messages: List[Dict[str, str]], text: str) -> List[str]:
+        if not stage_allowed("extract"):
+            record_degradation("extract", "keyword_match")
+            return VOCAB.scan(text)
 
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=messages,
-                temperature=0.0
-            )
-            content = response.choices[0].message.content.strip()
-            symptoms = json.loads(content)
-            if isinstance(symptoms, list):
-                return symptoms
+            if self.router:
+                content = self.router.complete(task, messages, model="gpt-3.5-turbo",
+                                               temperature=0.0, max_new_tokens=128,
+                                               validate=_is_symptom_list, timeout=stage_timeout(15))
+            elif self.cache:
+                content = self.cache.complete(self.client, "gpt-3.5-turbo", messages, temperature=0.0,
+                                              validate=_is_symptom_list, timeout=stage_timeout(15))
             else:
-                raise ValueError(f"Expected a JSON list, got: {type(symptoms)}")
+                response = self.client.chat.completions.create(
+                    model="gpt-3.5-turbo",
+                    messages=messages,
+                    temperature=0.0,
+                    timeout=stage_timeout(15)
+                )
+                content = response.choices[0].message.content.strip()
+            symptoms = parse_symptom_list(content)
+            if symptoms is None:
+                raise ValueError(f"Expected a JSON list of symptoms, got: {content[:200]!r}")
+            return symptoms
         except Exception as e:
             logger.error(f"[SymptomExtractor] Error: {e}")
             return []
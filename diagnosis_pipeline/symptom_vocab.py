@@ -0,0 +1,211 @@
+import re
+import threading
+from array import array
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterable, List, Optional, Set
+
+# Lay terms and variants folded onto one canonical symptom name
+SYNONYMS: Dict[str, str] = {
+    "high temperature": "fever",
+    "temperature": "fever",
+    "pyrexia": "fever",
+    "febrile": "fever",
+    "head ache": "headache",
+    "head pain": "headache",
+    "throwing up": "vomiting",
+    "vomit": "vomiting",
+    "tired": "fatigue",
+    "tiredness": "fatigue",
+    "exhaustion": "fatigue",
+    "lethargy": "fatigue",
+    "short of breath": "shortness of breath",
+    "breathlessness": "shortness of breath",
+    "dyspnea": "shortness of breath",
+    "dyspnoea": "shortness of breath",
+    "nauseous": "nausea",
+    "feeling sick": "nausea",
+    "diarrhoea": "diarrhea",
+    "loose stools": "diarrhea",
+    "stomach ache": "abdominal pain",
+    "stomach pain": "abdominal pain",
+    "belly pain": "abdominal pain",
+    "tummy ache": "abdominal pain",
+    "coughing": "cough",
+    "shivering": "chills",
+    "dizzy": "dizziness",
+    "lightheaded": "dizziness",
+    "light headed": "dizziness",
+    "myalgia": "muscle pain",
+    "muscle aches": "muscle pain",
+    "body aches": "muscle pain",
+    "arthralgia": "joint pain",
+    "itchy": "itching",
+    "pruritus": "itching",
+    "runny nose": "runny nose",
+    "rhinorrhea": "runny nose",
+    "skin rash": "rash",
+}
+
+
+class _PinScope:
+    __slots__ = ("ids", "open")
+
+    def __init__(self):
+        self.ids: Set[int] = set()
+        self.open = True
+
+
+_pin_scope: ContextVar[Optional[_PinScope]] = ContextVar("symptom_vocab_pins", default=None)
+
+
+def normalize_symptom(symptom: str) -> str:
+    """Lowercase, treat underscores as spaces, drop edge punctuation and collapse whitespace."""
+    text = symptom.lower().replace("_", " ")
+    text = re.sub(r"\s+", " ", text)
+    return text.strip(" \t\n.,;:!?'\"-")
+
+
+class SymptomVocabulary:
+    """Interning of the known symptom vocabulary to dense integer IDs.
+
+    The vocabulary is built from the disease data at load time (``intern`` /
+    ``encode(..., intern=True)``) and never grows from user input. Any other name,
+    such as free text from a patient or a model, gets a transient ID at or above
+    ``TRANSIENT_BASE`` from a bounded LRU table, so it is only meant to be decoded
+    within the request that encoded it; ``pinned()`` keeps them from being evicted
+    until the request ends. Components exchange compact ``array('I')`` ID arrays;
+    names are materialized for prompts and for state that must survive across
+    processes (IDs are assigned in first-seen order, so they are not stable across
+    workers).
+    """
+
+    TRANSIENT_BASE = 1 << 31
+
+    def __init__(self, synonyms: Optional[Dict[str, str]] = None, max_transient: int = 4096):
+        self.synonyms = {normalize_symptom(k): normalize_symptom(v) for k, v in (synonyms or SYNONYMS).items()}
+        self.max_transient = max_transient
+        self._ids: Dict[str, int] = {}
+        self._names: List[str] = []
+        self._transient_ids: "OrderedDict[str, int]" = OrderedDict()
+        self._transient_names: Dict[int, str] = {}
+        self._pin_counts: Counter = Counter()
+        self._next_transient = self.TRANSIENT_BASE
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def canonical(self, symptom: str) -> str:
+        normalized = normalize_symptom(symptom)
+        return self.synonyms.get(normalized, normalized)
+
+    def intern(self, symptom: str) -> int:
+        """Permanent ID for a vocabulary symptom; only for the known disease data."""
+        name = self.canonical(symptom)
+        sid = self._ids.get(name)
+        if sid is None:
+            with self._lock:
+                sid = self._ids.get(name)
+                if sid is None:
+                    sid = len(self._names)
+                    self._names.append(name)
+                    self._ids[name] = sid
+        return sid
+
+    def lookup(self, symptom: str) -> int:
+        """Vocabulary ID, or a transient one for a name outside the vocabulary."""
+        name = self.canonical(symptom)
+        sid = self._ids.get(name)
+        if sid is not None:
+            return sid
+        with self._lock:
+            sid = self._transient_ids.get(name)
+            if sid is not None:
+                self._transient_ids.move_to_end(name)
+            else:
+                sid = self._next_transient
+                self._next_transient = self.TRANSIENT_BASE + (sid + 1 - self.TRANSIENT_BASE) % self.TRANSIENT_BASE
+                self._transient_ids[name] = sid
+                self._transient_names[sid] = name
+            scope = _pin_scope.get()
+            if scope is not None and scope.open and sid not in scope.ids:
+                scope.ids.add(sid)
+                self._pin_counts[sid] += 1
+            self._evict()
+        return sid
+
+    def _evict(self):
+        """Drop least recently used transient names beyond max_transient, skipping pinned ones."""
+        excess = len(self._transient_ids) - self.max_transient
+        if excess <= 0:
+            return
+        victims = []
+        for name, sid in self._transient_ids.items():
+            if sid not in self._pin_counts:
+                victims.append((name, sid))
+                if len(victims) == excess:
+                    break
+        for name, sid in victims:
+            del self._transient_ids[name]
+            del self._transient_names[sid]
+
+    @contextmanager
+    def pinned(self):
+        """Keep transient IDs looked up in this context decodable until it exits.
+
+        Wrap a request in it so the ID arrays it holds stay valid however many
+        other names concurrent requests look up meanwhile.
+        """
+        scope = _PinScope()
+        token = _pin_scope.set(scope)
+        try:
+            yield
+        finally:
+            _pin_scope.reset(token)
+            with self._lock:
+                # Work that copied this context (speculation) may outlive it; stop pinning for it
+                scope.open = False
+                for sid in scope.ids:
+                    self._pin_counts[sid] -= 1
+                    if self._pin_counts[sid] <= 0:
+                        del self._pin_counts[sid]
+                self._evict()
+
+    def encode(self, symptoms: Iterable[str], intern: bool = False) -> array:
+        """Order-preserving, de-duplicated ID array; blank entries are dropped."""
+        to_id = self.intern if intern else self.lookup
+        ids = array("I")
+        seen = set()
+        for symptom in symptoms:
+            if not normalize_symptom(symptom):
+                continue
+            sid = to_id(symptom)
+            if sid not in seen:
+                seen.add(sid)
+                ids.append(sid)
+        return ids
+
+    def decode(self, ids: Iterable[int]) -> List[str]:
+        return [self._names[i] if i < self.TRANSIENT_BASE else self._transient_names[i] for i in ids]
+
+    def dedupe(self, symptoms: Iterable[str]) -> List[str]:
+        """Canonical names with duplicates (after normalization and synonym folding) removed."""
+        return self.decode(self.encode(symptoms))
+
+    def scan(self, text: str) -> List[str]:
+        """Known symptoms (or their synonyms) mentioned in free text, in order of appearance.
+
+        A keyword fallback for when there is no time left for LLM extraction.
+        """
+        padded = f" {' '.join(re.sub(r'[^a-z0-9]+', ' ', text.lower().replace('_', ' ')).split())} "
+        found = []
+        for term in [*self._names, *self.synonyms]:
+            position = padded.find(f" {term} ")
+            if position >= 0:
+                found.append((position, term))
+        return self.dedupe(term for _, term in sorted(found))
+
+
+VOCAB = SymptomVocabulary()
@@ -0,0 +1,79 @@
+# Evaluate (and optionally train/save) the local intent classifier.
+#
+#   python eval_intent.py                          # k-fold CV on data/intent_examples.jsonl
+#   python eval_intent.py --data labeled.jsonl --save intent_model.json
+
+import argparse
+import random
+import time
+from collections import Counter
+
+from diagnosis_pipeline.intent_classifier import (
+    IntentClassifier,
+    INTENT_CONFIDENCE_THRESHOLD,
+    INTENT_EXAMPLES_PATH,
+    SEED_EXAMPLES,
+    load_examples
+)
+
+
+def evaluate(train, test, threshold):
+    clf = IntentClassifier(threshold=threshold).train(train)
+    results = []
+    start = time.perf_counter()
+    for text, label in test:
+        predicted, confidence = clf.predict(text)
+        results.append((label, predicted, confidence))
+    elapsed = time.perf_counter() - start
+    return results, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate the local intent classifier")
+    parser.add_argument("--data", default=INTENT_EXAMPLES_PATH, help="JSONL of {text, label}")
+    parser.add_argument("--seed-only", action="store_true", help="Use only the built-in seed examples")
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--threshold", type=float, default=INTENT_CONFIDENCE_THRESHOLD)
+    parser.add_argument("--save", help="Train on all data and save the model to this path")
+    args = parser.parse_args()
+
+    examples = list(SEED_EXAMPLES) if args.seed_only else load_examples(args.data)
+    random.Random(0).shuffle(examples)
+
+    results, elapsed = [], 0.0
+    for k in range(args.folds):
+        test = examples[k::args.folds]
+        train = [e for i, e in enumerate(examples) if i % args.folds != k]
+        fold_results, fold_elapsed = evaluate(train, test, args.threshold)
+        results += fold_results
+        elapsed += fold_elapsed
+
+    correct = sum(label == predicted for label, predicted, _ in results)
+    confident = [(l, p) for l, p, c in results if c >= args.threshold]
+    print(f"Examples:            {len(results)}")
+    print(f"Accuracy:            {correct / len(results):.1%}")
+    print(f"Escalated to LLM:    {1 - len(confident) / len(results):.1%} (threshold {args.threshold})")
+    if confident:
+        print(f"Accuracy when local: {sum(l == p for l, p in confident) / len(confident):.1%}")
+    print(f"Latency:             {elapsed / len(results) * 1e6:.1f} µs/message\n")
+
+    tp, fp, fn = Counter(), Counter(), Counter()
+    for label, predicted, _ in results:
+        if label == predicted:
+            tp[label] += 1
+        else:
+            fp[predicted] += 1
+            fn[label] += 1
+    print(f"{'label':<20}{'precision':>10}{'recall':>10}")
+    for label in sorted(set(l for l, _, _ in results)):
+        precision = tp[label] / ((tp[label] + fp[label]) or 1)
+        recall = tp[label] / ((tp[label] + fn[label]) or 1)
+        print(f"{label:<20}{precision:>10.2f}{recall:>10.2f}")
+
+    if args.save:
+        IntentClassifier(threshold=args.threshold).train(examples).save(args.save)
+        print(f"\nSaved model to {args.save}")
+
+
+if __name__ == "__main__":
+    main()
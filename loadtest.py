@@ -0,0 +1,505 @@
+# loadtest.py
+#
+# Soak/load test for the /chat API on a single box, with no external services.
+# The real FastAPI app, SessionOrchestrator, session store and MedicalAssistant
+# (agents, LLM cache, model router, deadlines, ICD index, knowledge index and
+# DiseasePredictor) are used; only the network and GPU back ends - the OpenAI
+# client, the Pinecone index and the model server client - are replaced by fakes
+# with configurable latency distributions. ICD codes come from the offline index.
+#
+#   python loadtest.py --patients 50 --duration 60 --workers 2 \
+#       --latency openai=lognormal:600:0.5 --latency model=lognormal:1200:0.3 \
+#       --max-p99-ms 15000 --max-error-rate 0.01 --max-rss-mb 2048
+
+import argparse
+import csv
+import http.client
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import zlib
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_LATENCY = {
+    "openai": "lognormal:500:0.5",
+    "pinecone": "lognormal:80:0.4",
+    "model": "lognormal:900:0.3",
+}
+
+# (disease, ICD-10 code, symptoms, treatment): the fake disease tables the assistant loads
+DISEASES = [
+    ("influenza", "J11.1", ["fever", "chills", "muscle pain", "cough", "fatigue", "headache"],
+     "Rest, fluids and antipyretics"),
+    ("common cold", "J00", ["runny nose", "sore throat", "cough", "sneezing"], "Rest and fluids"),
+    ("migraine", "G43.909", ["headache", "nausea", "dizziness", "sensitivity to light"],
+     "Analgesics and rest in a dark room"),
+    ("gastroenteritis", "A09", ["nausea", "vomiting", "diarrhea", "abdominal pain", "fever"],
+     "Oral rehydration"),
+    ("covid-19", "U07.1", ["fever", "cough", "fatigue", "shortness of breath", "loss of smell"],
+     "Isolation, rest and fluids"),
+    ("asthma", "J45.909", ["shortness of breath", "wheezing", "cough", "chest tightness"], "Inhaled bronchodilators"),
+]
+SYMPTOM_POOL = sorted({symptom for _, _, symptoms, _ in DISEASES for symptom in symptoms})
+OPENERS = [
+    "I've had {a} and {b} for two days",
+    "My {a} is getting worse and I also have {b}",
+    "I woke up with {a}, {b} and some {c}",
+]
+ANSWERS = ["yes", "no", "a little", "not really", "yes and it gets worse at night",
+           "it started on Monday", "about 6 out of 10"]
+
+
+# ───────── Back-end fakes ─────────
+
+class LatencyModel:
+    """Sample service latency from ``fixed:<ms>``, ``uniform:<lo>:<hi>``, or ``lognormal:<median_ms>:<sigma>``."""
+
+    def __init__(self, spec: str):
+        kind, *params = spec.split(":")
+        self.kind = kind
+        self.params = [float(p) for p in params]
+
+    def sample(self) -> float:
+        if self.kind == "fixed":
+            return self.params[0] / 1000
+        if self.kind == "uniform":
+            return random.uniform(*self.params) / 1000
+        if self.kind == "lognormal":
+            median, sigma = self.params
+            return random.lognormvariate(0, sigma) * median / 1000
+        raise ValueError(f"Unknown latency distribution: {self.kind}")
+
+
+class Backends:
+    """Latency and failure injection shared by the fakes of one worker."""
+
+    def __init__(self, latency: Dict[str, str], error_rate: float = 0.0):
+        self.latency = {name: LatencyModel(spec) for name, spec in latency.items()}
+        self.error_rate = error_rate
+
+    def call(self, service: str):
+        time.sleep(self.latency[service].sample())
+        if self.error_rate and random.random() < self.error_rate:
+            raise ConnectionError(f"fake {service} failure")
+
+
+def _mentioned(text: str) -> List[str]:
+    text = text.lower()
+    return [s for s in SYMPTOM_POOL if s in text]
+
+
+def fake_reply(messages: List[Dict[str, str]]) -> str:
+    """A well-formed reply to each prompt the assistant's agents send, keyed on the prompt text."""
+    system = messages[0]["content"] if messages[0]["role"] == "system" else ""
+    text = messages[-1]["content"]
+    if "Classify the user's message" in system:
+        if _mentioned(text):
+            return "symptom_diagnosis"
+        return "patient_history" if any(w in text.lower() for w in ("take", "history", "allergic")) else "chat"
+    if "JSON array of symptom" in system:
+        if text.startswith("Question: "):
+            question, _, answer = text[len("Question: "):].partition("\nAnswer: ")
+            confirmed = _mentioned(question) if answer.lower().startswith("yes") else []
+            return json.dumps(confirmed + _mentioned(answer))
+        return json.dumps(_mentioned(text))
+    if "clinical reasoning" in system:
+        return "1. Pathophysiological basis: consistent.\n2. Diagnostic criteria: met.\nFinal analysis: likely."
+    if text.startswith("Here is a detailed clinical reasoning"):
+        return ("The reported symptoms are consistent with the leading diagnosis. "
+                "This is not medical advice—please consult a qualified healthcare professional.")
+    if "precautions" in system:
+        return "- Rest\n- Stay hydrated\n- Seek care if symptoms worsen"
+    if "Missing Symptoms: " in text or "whether they have: " in text:
+        asked = text.split("Missing Symptoms: ")[-1].split("whether they have: ")[-1].split("\n")[0]
+        return f"Are you experiencing {asked.replace(', ', ' or ')}?"
+    if "Ask one follow-up question" in text:
+        return "Could you tell me a bit more about that?"
+    return "Thanks for sharing. Describe your symptoms and I'll help."
+
+
+class FakeOpenAI:
+    """The ``chat.completions`` and ``embeddings`` surface of ``openai.OpenAI``."""
+
+    def __init__(self, backends: Backends, dimensions: int = 64):
+        self.backends = backends
+        self.dimensions = dimensions
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._complete))
+        self.embeddings = SimpleNamespace(create=self._embed)
+
+    def _complete(self, model: str, messages: List[Dict[str, str]], **params):
+        self.backends.call("openai")
+        message = SimpleNamespace(role="assistant", content=fake_reply(messages))
+        return SimpleNamespace(model=model, choices=[SimpleNamespace(index=0, message=message)])
+
+    def _embed(self, model: str, input, **params):
+        self.backends.call("openai")
+        texts = [input] if isinstance(input, str) else input
+        return SimpleNamespace(model=model, data=[SimpleNamespace(index=i, embedding=self._vector(t))
+                                                  for i, t in enumerate(texts)])
+
+    def _vector(self, text: str) -> List[float]:
+        # Deterministic bag-of-words hashing, so similar texts get similar vectors
+        vec = [0.0] * self.dimensions
+        for word in text.lower().split():
+            vec[zlib.crc32(word.encode("utf-8")) % self.dimensions] += 1.0
+        return vec
+
+
+class FakePineconeIndex:
+    """``Index.query`` returning diseases from the fake table; some without a code, to exercise the ICD mapper."""
+
+    def __init__(self, backends: Backends):
+        self.backends = backends
+
+    def query(self, vector: List[float], top_k: int = 5, include_metadata: bool = True) -> Dict:
+        self.backends.call("pinecone")
+        matches = []
+        for disease, code, _, _ in random.sample(DISEASES, min(3, top_k)):
+            matches.append({"metadata": {"disease": disease, "icd10": code if random.random() > 0.3 else ""},
+                            "score": random.uniform(0.3, 0.7)})
+        return {"matches": matches}
+
+
+class FakeModelClient:
+    """``ModelClient`` stand-in: disease candidates and local chat completions from one simulated GPU."""
+
+    def __init__(self, backends: Backends):
+        self.backends = backends
+        # The model serves one call at a time, like a single GPU
+        self._gpu = threading.Semaphore(1)
+
+    def _run(self):
+        with self._gpu:
+            self.backends.call("model")
+
+    def predict(self, symptoms: List[str], top_k: int = 5) -> List[Tuple[str, float]]:
+        self._run()
+        reported = set(symptoms)
+        ranked = sorted(DISEASES, key=lambda d: len(reported & set(d[2])) + random.random() / 2, reverse=True)
+        # Confidence rises as symptoms accumulate so conversations converge
+        base = min(0.95, 0.4 + 0.12 * len(symptoms))
+        return [(disease, base * random.uniform(0.8, 1.0) / (rank + 1))
+                for rank, (disease, _, _, _) in enumerate(ranked[:top_k])]
+
+    def generate(self, messages: List[Dict[str, str]], max_new_tokens: int = 256,
+                 temperature: float = 0.3, timeout: Optional[float] = None) -> str:
+        self._run()
+        return fake_reply(messages)
+
+
+class DiseaseCooccurrence:
+    """Candidate missing symptoms: those of the suspected diseases the patient has not reported."""
+
+    def top_candidates(self, symptoms: List[str], suspected: List[str], k: int = 3) -> List[str]:
+        reported = set(symptoms)
+        by_name = {disease: disease_symptoms for disease, _, disease_symptoms, _ in DISEASES}
+        candidates = []
+        for disease in suspected:
+            for symptom in by_name.get(disease, []):
+                if symptom not in reported and symptom not in candidates:
+                    candidates.append(symptom)
+        return candidates[:k]
+
+
+def write_disease_tables(directory: str) -> Tuple[str, str]:
+    """The disease CSV and metadata CSV MedicalAssistant loads, built from DISEASES."""
+    disease_csv = os.path.join(directory, "diseases.csv")
+    meta_csv = os.path.join(directory, "disease_meta.csv")
+    for path, header, rows in [
+        (disease_csv, ["disease", "cleaned_symptoms", "ICD-10 Code"],
+         [(d, repr(symptoms), code) for d, code, symptoms, _ in DISEASES]),
+        (meta_csv, ["disease", "combined_symptoms", "treatment"],
+         [(d, repr(symptoms), treatment) for d, _, symptoms, treatment in DISEASES]),
+    ]:
+        # Workers start concurrently; each writes its own copy and swaps it in atomically
+        tmp = f"{path}.{os.getpid()}"
+        with open(tmp, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            writer.writerows(rows)
+        os.replace(tmp, path)
+    return disease_csv, meta_csv
+
+
+def build_app():
+    """uvicorn factory: ``uvicorn loadtest:build_app --factory``; configured through env vars."""
+    from diagnosis_pipeline.admission import AdmissionController
+    from diagnosis_pipeline.api import create_app
+    from diagnosis_pipeline.intent_classifier import IntentClassifier
+    from diagnosis_pipeline.knowledge_index import KnowledgeIndex, openai_embedder
+    from diagnosis_pipeline.medical_assistant import MedicalAssistant
+    from diagnosis_pipeline.pubmed_ingest import IngestState, PubMedIngestor
+    from diagnosis_pipeline.session_store import SQLiteSessionStore
+    from diagnosis_pipeline.speculative import SpeculativeExecutor
+
+    latency = json.loads(os.environ.get("LOADTEST_LATENCY", json.dumps(DEFAULT_LATENCY)))
+    backends = Backends(latency, float(os.environ.get("LOADTEST_BACKEND_ERROR_RATE", "0")))
+    data_dir = os.environ.get("LOADTEST_DATA_DIR") or tempfile.mkdtemp(prefix="loadtest-data-")
+    disease_csv, meta_csv = write_disease_tables(data_dir)
+
+    openai_client = FakeOpenAI(backends)
+    # Per-worker evidence index over the bundled PubMed sample
+    worker_dir = os.path.join(data_dir, f"worker-{os.getpid()}")
+    knowledge = KnowledgeIndex(os.path.join(worker_dir, "knowledge"),
+                               embed_fn=openai_embedder("loadtest", client=openai_client))
+    PubMedIngestor(knowledge, state=IngestState(os.path.join(worker_dir, "ingest.sqlite3"))).ingest_xml()
+
+    assistant = MedicalAssistant(
+        tokenizer=None,
+        model=None,
+        gen_tokenizer=None,
+        gen_model=None,
+        openai_api_key="loadtest",
+        disease_csv_path=disease_csv,
+        meta_csv_path=meta_csv,
+        pinecone_index=FakePineconeIndex(backends),
+        knowledge_store=knowledge,
+        cooc_matrix=DiseaseCooccurrence(),
+        model_client=FakeModelClient(backends),
+        openai_client=openai_client
+    )
+    store = SQLiteSessionStore(os.environ.get("LOADTEST_SESSION_DB", "loadtest_sessions.sqlite3"))
+    admission = AdmissionController() if os.environ.get("LOADTEST_ADMISSION") == "1" else None
+    return create_app(assistant, store, speculator=SpeculativeExecutor(),
+                      intent_classifier=IntentClassifier.load_or_train(), admission=admission)
+
+
+# ───────── Load generator ─────────
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies: List[float] = []
+        self.errors = 0
+        self.shed = 0
+        self.conversations = 0
+        self.rss_samples: List[Tuple[float, Dict[int, float]]] = []
+
+    def record(self, latency: float, ok: bool, shed: bool = False):
+        with self.lock:
+            # Shed (429) replies are fast by design; latency percentiles cover served requests
+            if shed:
+                self.shed += 1
+                return
+            self.latencies.append(latency)
+            if not ok:
+                self.errors += 1
+
+
+def post_chat(conn: http.client.HTTPConnection, body: str) -> Tuple[http.client.HTTPConnection, int, Optional[str], bytes]:
+    """POST /chat, reconnecting and retrying once if the server dropped the idle keep-alive connection.
+
+    uvicorn closes connections idle for longer than its keep-alive timeout (5s),
+    which a virtual patient's think time regularly exceeds.
+    """
+    def send(conn):
+        conn.request("POST", "/chat", body, {"Content-Type": "application/json"})
+        resp = conn.getresponse()
+        return conn, resp.status, resp.getheader("Retry-After"), resp.read()
+
+    try:
+        return send(conn)
+    except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+        conn.close()
+        return send(http.client.HTTPConnection(conn.host, conn.port, timeout=conn.timeout))
+
+
+def virtual_patient(host: str, port: int, stop_at: float, stats: Stats, max_turns: int, think_time: float):
+    conn = http.client.HTTPConnection(host, port, timeout=120)
+    rng = random.Random()
+    while time.time() < stop_at:
+        session_id = uuid.uuid4().hex
+        a, b, c = rng.sample(SYMPTOM_POOL, 3)
+        script = [rng.choice(OPENERS).format(a=a, b=b, c=c),
+                  f"I'm {rng.randint(18, 80)} years old, {rng.choice(['male', 'female'])}, "
+                  f"{rng.randint(50, 110)} kg, {rng.randint(150, 195)} cm"]
+        turn = 0
+        while turn < max_turns:
+            message = script[turn] if turn < len(script) else rng.choice(ANSWERS)
+            body = json.dumps({"message": message, "session_id": session_id})
+            start = time.perf_counter()
+            retry_after = None
+            try:
+                conn, status, retry_header, payload = post_chat(conn, body)
+                # Only server failures count as errors; 4xx replies end the conversation without one
+                ok = status < 500
+                reply = json.loads(payload).get("response", "") if status == 200 else ""
+                if status == 429:
+                    retry_after = float(retry_header or "1")
+            except Exception:
+                status, ok, reply = None, False, ""
+                conn.close()
+                conn = http.client.HTTPConnection(host, port, timeout=120)
+            stats.record(time.perf_counter() - start, ok, shed=retry_after is not None)
+            if retry_after is not None:
+                # The shed turn was not applied; back off and resend it
+                time.sleep(retry_after)
+                if time.time() >= stop_at:
+                    break
+                continue
+            if status != 200 or "Diagnosis:" in reply or time.time() >= stop_at:
+                break
+            turn += 1
+            time.sleep(rng.expovariate(1 / think_time) if think_time > 0 else 0)
+        with stats.lock:
+            stats.conversations += 1
+
+
+def process_tree_rss(root_pid: int) -> Dict[int, float]:
+    """RSS in MB for root_pid and its direct children (uvicorn workers)."""
+    pids = [root_pid]
+    try:
+        with open(f"/proc/{root_pid}/task/{root_pid}/children") as f:
+            pids += [int(p) for p in f.read().split()]
+    except OSError:
+        pass
+    rss = {}
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        rss[pid] = int(line.split()[1]) / 1024
+        except OSError:
+            continue
+    return rss
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def wait_for_server(host: str, port: int, timeout: float = 60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=2)
+            conn.request("GET", "/health")
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.25)
+    raise RuntimeError("Server did not become healthy in time")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Concurrent soak test for the /chat API with fake back ends")
+    parser.add_argument("--patients", type=int, default=50, help="Concurrent virtual patients")
+    parser.add_argument("--duration", type=float, default=60, help="Test duration in seconds")
+    parser.add_argument("--ramp-up", type=float, default=5, help="Seconds over which patients start")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--max-turns", type=int, default=8)
+    parser.add_argument("--think-time", type=float, default=1.0, help="Mean seconds between turns")
+    parser.add_argument("--latency", action="append", default=[],
+                        help="service=distribution, e.g. openai=lognormal:500:0.5 (services: "
+                             + ", ".join(DEFAULT_LATENCY) + ")")
+    parser.add_argument("--backend-error-rate", type=float, default=0.0)
+    parser.add_argument("--admission", action="store_true",
+                        help="Enable admission control; 429s are counted as shed, not errors")
+    parser.add_argument("--max-p99-ms", type=float)
+    parser.add_argument("--max-error-rate", type=float)
+    parser.add_argument("--max-rss-mb", type=float, help="Per-process RSS limit")
+    parser.add_argument("--min-throughput", type=float, help="Minimum requests/second")
+    args = parser.parse_args()
+
+    latency = dict(DEFAULT_LATENCY)
+    for item in args.latency:
+        service, spec = item.split("=", 1)
+        LatencyModel(spec)  # validate early
+        latency[service] = spec
+
+    workdir = tempfile.mkdtemp(prefix="loadtest-")
+    env = dict(os.environ,
+               LOADTEST_LATENCY=json.dumps(latency),
+               LOADTEST_BACKEND_ERROR_RATE=str(args.backend_error_rate),
+               LOADTEST_ADMISSION="1" if args.admission else "0",
+               LOADTEST_SESSION_DB=os.path.join(workdir, "sessions.sqlite3"),
+               LOADTEST_DATA_DIR=workdir,
+               # ICD codes come from the offline index; never call the WHO API
+               ICD_CLIENT_ID="",
+               ICD_CLIENT_SECRET="",
+               INTENT_MODEL_PATH=os.path.join(workdir, "intent_model.json"),
+               LLM_CACHE_PATH=os.path.join(workdir, "llm_cache.sqlite3"))
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "loadtest:build_app", "--factory",
+         "--host", "127.0.0.1", "--port", str(args.port), "--workers", str(args.workers),
+         "--log-level", "warning"],
+        env=env, cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+
+    stats = Stats()
+    try:
+        wait_for_server("127.0.0.1", args.port)
+        start = time.time()
+        stop_at = start + args.duration
+
+        def sample_memory():
+            while time.time() < stop_at:
+                stats.rss_samples.append((time.time() - start, process_tree_rss(server.pid)))
+                time.sleep(1)
+
+        threading.Thread(target=sample_memory, daemon=True).start()
+        threads = []
+        for i in range(args.patients):
+            t = threading.Thread(target=virtual_patient, daemon=True,
+                                 args=("127.0.0.1", args.port, stop_at, stats, args.max_turns, args.think_time))
+            t.start()
+            threads.append(t)
+            time.sleep(args.ramp_up / max(1, args.patients))
+        for t in threads:
+            t.join(timeout=args.duration + 180)
+        elapsed = time.time() - start
+    finally:
+        server.send_signal(signal.SIGINT)
+        try:
+            server.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+    requests_done = len(stats.latencies)
+    error_rate = stats.errors / requests_done if requests_done else 1.0
+    throughput = requests_done / elapsed
+    latencies_ms = [l * 1000 for l in stats.latencies]
+    peak_rss = max((mb for _, sample in stats.rss_samples for mb in sample.values()), default=0.0)
+
+    print(f"\nPatients: {args.patients}   workers: {args.workers}   duration: {elapsed:.1f}s")
+    print(f"Requests: {requests_done}   conversations: {stats.conversations}   errors: {stats.errors} ({error_rate:.2%})"
+          f"   shed: {stats.shed}")
+    print(f"Throughput: {throughput:.2f} req/s")
+    print("Latency ms: " + "  ".join(f"p{p}={percentile(latencies_ms, p):.0f}" for p in (50, 90, 95, 99))
+          + f"  max={max(latencies_ms, default=0):.0f}")
+    print("Memory (MB, per process) over time:")
+    for t, sample in stats.rss_samples[::max(1, len(stats.rss_samples) // 10)]:
+        print(f"  t={t:5.0f}s  " + "  ".join(f"{pid}:{mb:.0f}" for pid, mb in sorted(sample.items())))
+
+    failures = []
+    if args.max_p99_ms is not None and percentile(latencies_ms, 99) > args.max_p99_ms:
+        failures.append(f"p99 {percentile(latencies_ms, 99):.0f}ms > {args.max_p99_ms:.0f}ms")
+    if args.max_error_rate is not None and error_rate > args.max_error_rate:
+        failures.append(f"error rate {error_rate:.2%} > {args.max_error_rate:.2%}")
+    if args.max_rss_mb is not None and peak_rss > args.max_rss_mb:
+        failures.append(f"peak RSS {peak_rss:.0f}MB > {args.max_rss_mb:.0f}MB")
+    if args.min_throughput is not None and throughput < args.min_throughput:
+        failures.append(f"throughput {throughput:.2f} < {args.min_throughput:.2f} req/s")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if not failures:
+        print("PASS")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,46 +1,52 @@
 # main.py
 
-from fastapi import FastAPI, Request
-from pydantic import BaseModel
-from diagnosis_pipeline.load_models import (
-    load_symptom_extraction_model,
-    load_disease_prediction_model,
-    load_reasoning_pipeline
-)
+from diagnosis_pipeline.model_server import ModelClient
 from diagnosis_pipeline.medical_assistant import MedicalAssistant
-from diagnosis_pipeline.session_orchestrator import SessionOrchestrator
+from diagnosis_pipeline.retriever import open_pinecone_index
+from diagnosis_pipeline.knowledge_index import KnowledgeIndex, openai_embedder
+from diagnosis_pipeline.api import create_app
+from diagnosis_pipeline.session_store import create_session_store
+from diagnosis_pipeline.speculative import SpeculativeExecutor
+from diagnosis_pipeline.intent_classifier import IntentClassifier
+from diagnosis_pipeline.admission import AdmissionController
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
 # ───────── Load models ──────────
-symptom_tokenizer, symptom_model = load_symptom_extraction_model()
-disease_tokenizer, disease_model = load_disease_prediction_model()
-gen_model = load_reasoning_pipeline()
+# With USE_MODEL_SERVER=1 the models live in one `python -m diagnosis_pipeline.model_server`
+# process and each API worker only holds a socket client.
+model_client = None
+if os.getenv("USE_MODEL_SERVER") == "1":
+    model_client = ModelClient()
+    tokenizer = model = gen_tokenizer = gen_model = None
+else:
+    from diagnosis_pipeline.load_models import load_models
+    tokenizer, model, gen_tokenizer, gen_model = load_models()
 
 # ───────── Init assistant ───────
+openai_api_key = os.getenv("OPENAI_API_KEY")
 assistant = MedicalAssistant(
-    tokenizer=symptom_tokenizer,
-    model=symptom_model,
-    gen_tokenizer=disease_tokenizer,
+    tokenizer=tokenizer,
+    model=model,
+    gen_tokenizer=gen_tokenizer,
     gen_model=gen_model,
+    model_client=model_client,
     disease_csv_path="data/disease_prediction_cleaned_deduplicated.csv",
-    openai_api_key=os.getenv("OPENAI_API_KEY"),
-    pinecone_api_key=os.getenv("PINECONE_API_KEY"),
-    pinecone_index_name=os.getenv("PINECONE_INDEX")
+    openai_api_key=openai_api_key,
+    pinecone_index=open_pinecone_index(),
+    knowledge_store=KnowledgeIndex(embed_fn=openai_embedder(openai_api_key))
 )
 
 # ───────── Init session manager ───────
-session = SessionOrchestrator(assistant)
+# Conversation state lives in the session store, so any worker can serve any turn
+session_store = create_session_store()
+speculator = SpeculativeExecutor()
+intent_classifier = IntentClassifier.load_or_train()
+# Bounded, prioritized queue in front of the GPU-bound prediction stage (per worker)
+admission = AdmissionController()
 
 # ───────── FastAPI Setup ───────
-app = FastAPI()
-
-class Query(BaseModel):
-    message: str
-
-@app.post("/chat")
-async def chat_handler(query: Query):
-    reply = session.handle(query.message)
-    return {"response": reply}
+app = create_app(assistant, session_store, speculator=speculator, intent_classifier=intent_classifier,
+                 admission=admission)